@@ -0,0 +1,619 @@
+# File: benchmark.py
+# Benchmarks for the GatorLibrary Management System data structures
+
+'''
+Micro-benchmarks and the per-command benchmark suite for gatorLibrary.py.
+Run as: python3 benchmark.py <benchmark> [--books N]
+        python3 benchmark.py suite [--sizes 1000 10000 ...] [--distribution zipf] [--json results.json]
+'''
+
+# Import necessary modules
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+
+from gatorLibrary import (BOOK_CACHE_SIZE, BookNode, COMMANDS, Journal, JOURNALED_COMMANDS, LibraryManagementSystem,
+                          PersistentRedBlackTree, RedBlackTree, SCAN_CHUNK, ShardedLibrary, TREE_ENGINES,
+                          WAITLIST_BACKENDS,
+                          execute_command, mapped_commands, parse_line, read_commands, run_sharded)
+from workload import DEFAULT_MIX, catalog_lines, generate, parse_mix, zipf_sampler
+
+
+# Create n book nodes sorted by bookId
+def make_books(n):
+    return [BookNode(bookId, f'"Title {bookId}"', f'"Author {bookId % 997}"', '"Yes"') for bookId in range(1, n + 1)]
+
+
+# Time a function call and return (seconds, result)
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+# Compare RedBlackTree.bulk_load against repeated RedBlackTree.insert on the same sorted catalog
+def bench_bulk_load(options):
+    books = options.books
+    def insert_all(catalog):
+        tree = RedBlackTree()
+        for book in catalog:
+            tree.insert(book)
+        return tree
+
+    def bulk_load_all(catalog):
+        tree = RedBlackTree()
+        tree.bulk_load(catalog)
+        return tree
+
+    insert_time, _ = timed(insert_all, make_books(books))
+    bulk_time, _ = timed(bulk_load_all, make_books(books))
+    print(f"books={books}")
+    print(f"repeated insert: {insert_time:.3f}s ({books / insert_time:,.0f} books/s)")
+    print(f"bulk_load:       {bulk_time:.3f}s ({books / bulk_time:,.0f} books/s)")
+    print(f"speedup:         {insert_time / bulk_time:.1f}x")
+
+
+# Measure the memory allocated per book for a catalog built with repeated insert
+def bench_memory(options):
+    books = options.books
+    tracemalloc.start()
+    tree = RedBlackTree()
+    for book in make_books(books):
+        tree.insert(book)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"books={books}")
+    print(f"allocated: {allocated:,} bytes ({allocated / books:.1f} bytes/book)")
+
+
+# Mix of the circulation workloads
+CIRCULATION_MIX = {"BorrowBook": 45, "ReturnBook": 40, "PrintBook": 15}
+
+
+# Create a catalog of n books inserted with InsertBook followed by a random circulation workload, as parsed commands
+def make_circulation(n, operations, seed=0):
+    commands = [f"InsertBook({line})" for line in catalog_lines(n)]
+    commands.extend(generate(n, operations, CIRCULATION_MIX, seed=seed))
+    return [(line, *parse_line(line)) for line in commands]
+
+
+# Run parsed commands against a fresh library, journaling mutations if a journal is given
+def run_commands(commands, journal=None):
+    library = LibraryManagementSystem()
+    for line, comm, args in commands:
+        if journal is not None and comm in JOURNALED_COMMANDS:
+            journal.record(line)
+        execute_command(library, comm, args)
+    if journal is not None:
+        journal.close()
+    return library
+
+
+# Compare throughput with journaling off and with several group-commit sizes
+def bench_journal(options):
+    books = options.books
+    commands = make_circulation(books, books * 2)
+    baseline, _ = timed(run_commands, commands)
+    print(f"commands={len(commands)}")
+    print(f"in-memory:           {len(commands) / baseline:,.0f} ops/s")
+    with tempfile.TemporaryDirectory() as directory:
+        for group_size in (1, 16, 256, 4096):
+            path = os.path.join(directory, f"journal_{group_size}.log")
+            elapsed, _ = timed(run_commands, commands, Journal(path, group_size))
+            print(f"journal group={group_size:<5} {len(commands) / elapsed:,.0f} ops/s "
+                  f"({elapsed / baseline:.2f}x baseline time)")
+
+
+# Compare one-by-one circulation against LibraryManagementSystem.execute_batch on a bulk-loaded catalog
+def bench_batch(options):
+    books = options.books
+    rng = random.Random(0)
+    operations = []
+    for _ in range(books):
+        bookId = rng.randint(1, books)
+        if rng.random() < 0.7:
+            operations.append(("BorrowBook", [rng.randint(1, 1000), bookId, rng.randint(1, 5)]))
+        else:
+            operations.append(("ReturnBook", [rng.randint(1, 1000), bookId]))
+
+    def one_by_one(library):
+        for comm, args in operations:
+            if comm == "BorrowBook":
+                library.borrow_book(*args)
+            else:
+                library.return_book(*args)
+
+    def make_library():
+        library = LibraryManagementSystem()
+        library.bookTree.bulk_load(make_books(books))
+        return library
+
+    single_time, _ = timed(one_by_one, make_library())
+    batch_time, _ = timed(make_library().execute_batch, operations)
+    print(f"books={books} operations={len(operations)}")
+    print(f"one by one:    {len(operations) / single_time:,.0f} ops/s")
+    print(f"execute_batch: {len(operations) / batch_time:,.0f} ops/s ({single_time / batch_time:.2f}x)")
+
+
+# Parser used by main() before the table-driven parser, kept for comparison
+def legacy_parse(command_string):
+    parts = command_string.split('(')
+    comm = parts[0].strip()
+    if len(parts) > 1:
+        inputArgs = parts[1].rstrip(')').split(',')
+        return comm, [arg.strip() for arg in inputArgs]
+    return comm, []
+
+
+# Compare parsing plus argument conversion of a command log with the legacy parser and parse_line
+def bench_parse(options):
+    books = options.books
+    lines = [line for line, _, _ in make_circulation(books, books * 9)]
+
+    def legacy(command_lines):
+        for line in command_lines:
+            comm, args = legacy_parse(line)
+            # the legacy if/elif dispatch chain, converting the arguments in each branch
+            if comm == "InsertBook":
+                int(args[0])
+            elif comm == "PrintBook":
+                int(args[0])
+            elif comm == "PrintBooks":
+                int(args[0]), int(args[1])
+            elif comm == "FindClosestBook":
+                int(args[0])
+            elif comm == "BorrowBook":
+                int(args[0]), int(args[1]), int(args[2])
+            elif comm == "ReturnBook":
+                int(args[0]), int(args[1])
+
+    def table_driven(command_lines):
+        for line in command_lines:
+            comm, args = parse_line(line)
+            COMMANDS[comm] # dispatch table lookup
+
+    # best of seven alternating runs, parsing is short enough for scheduling noise to matter
+    def compare(command_lines):
+        legacy_time = table_time = float("inf")
+        for _ in range(7):
+            legacy_time = min(legacy_time, timed(legacy, command_lines)[0])
+            table_time = min(table_time, timed(table_driven, command_lines)[0])
+        return legacy_time, table_time
+
+    legacy_time, table_time = compare(lines)
+    print(f"lines={len(lines)}")
+    print(f"legacy split parser: {len(lines) / legacy_time:,.0f} lines/s")
+    print(f"parse_line:          {len(lines) / table_time:,.0f} lines/s ({legacy_time / table_time:.2f}x)")
+    by_command = {}
+    for line in lines:
+        by_command.setdefault(line[:line.find("(")], []).append(line)
+    for comm, command_lines in sorted(by_command.items()):
+        legacy_time, table_time = compare(command_lines)
+        print(f"  {comm:<12} {legacy_time / table_time:.2f}x")
+
+
+# Repeated PrintBooks over a bulk-loaded catalog: the first pass renders every book, later passes reuse the
+# cached blocks, and a pass after a circulation round re-renders only the books whose state changed
+def bench_render(options):
+    books = options.books
+    library = LibraryManagementSystem()
+    library.bookTree.bulk_load(make_books(books))
+    print_all = COMMANDS["PrintBooks"][0]
+    cold, _ = timed(print_all, library, 1, books)
+    warm = min(timed(print_all, library, 1, books)[0] for _ in range(3))
+    rng = random.Random(options.seed)
+    for _ in range(books // 100):
+        library.borrow_book(rng.randint(1, 1000), rng.randint(1, books), rng.randint(1, 5))
+    changed, _ = timed(print_all, library, 1, books)
+    print(f"books={books}")
+    print(f"first PrintBooks:       {cold * 1e3:8.1f} ms")
+    print(f"repeated PrintBooks:    {warm * 1e3:8.1f} ms ({cold / warm:.1f}x)")
+    print(f"after {books // 100} borrows:     {changed * 1e3:8.1f} ms")
+
+
+# Steady-state waitlist traffic for each backend and waitlist length: every step adds a reservation and then
+# hands the book off (remove_min) or cancels a random reservation, with a WaitlistPosition query every 8 steps
+def bench_waitlist(options):
+    steps = options.operations
+    print(f"steps={steps}")
+    print(f"{'length':>8} " + " ".join(f"{name:>12}" for name in WAITLIST_BACKENDS) + "  fastest")
+    for length in (4, 20, 100, 1000, 10000):
+        rng = random.Random(options.seed)
+        script = [(rng.randint(1, 5), rng.random() < 0.7, rng.randrange(length)) for _ in range(steps)]
+        rates = {}
+        for name, backend in WAITLIST_BACKENDS.items():
+            waitlist = backend()
+            patrons = list(range(length)) # waiting patrons, slots maps each to its position in the list
+            slots = {patronId: patronId for patronId in patrons}
+            for patronId in patrons:
+                waitlist.add(patronId, rng.randint(1, 5))
+
+            def drop(patronId):
+                slot = slots.pop(patronId)
+                last = patrons.pop()
+                if last != patronId:
+                    patrons[slot] = last
+                    slots[last] = slot
+
+            next_patron = length
+            start = time.perf_counter()
+            for step, (priority, hand_off, victim) in enumerate(script):
+                waitlist.add(next_patron, priority)
+                slots[next_patron] = len(patrons)
+                patrons.append(next_patron)
+                next_patron += 1
+                if step % 8 == 0:
+                    waitlist.position(patrons[victim])
+                if hand_off:
+                    drop(waitlist.remove_min()[2])
+                else:
+                    drop(waitlist.remove_patron(patrons[victim])[2])
+            rates[name] = steps / (time.perf_counter() - start)
+        print(f"{length:>8} " + " ".join(f"{rate:>12,.0f}" for rate in rates.values()) +
+              f"  {max(rates, key=rates.get)}")
+
+
+# Run a mixed command log in one process and with 1, 2, 4, ... shards up to the number of cores
+def bench_shards(options):
+    books = options.books
+    with tempfile.TemporaryDirectory() as directory:
+        catalog_path = os.path.join(directory, "catalog.txt")
+        with open(catalog_path, "w") as catalog_file:
+            for line in catalog_lines(books):
+                catalog_file.write(line + "\n")
+        lines = [f'LoadCatalog("{catalog_path}")']
+        lines.extend(generate(books, options.operations, options.mix, options.distribution, options.seed))
+
+        def single_process():
+            library = LibraryManagementSystem()
+            for line in lines:
+                output_line = execute_command(library, *parse_line(line))
+                if output_line is not None:
+                    str(output_line)
+
+        def sharded(shards):
+            router = ShardedLibrary(shards, books)
+            with open(os.devnull, "w") as output_file:
+                start = time.perf_counter()
+                run_sharded(lines, output_file, router, quiet=True)
+                elapsed = time.perf_counter() - start
+            router.close()
+            return elapsed
+
+        print(f"books={books} commands={len(lines)} cores={os.cpu_count()}")
+        baseline, _ = timed(single_process)
+        print(f"single process: {len(lines) / baseline:>10,.0f} commands/s")
+        shards = 1
+        while shards <= max(1, os.cpu_count()):
+            elapsed = sharded(shards)
+            print(f"shards={shards:<3}       {len(lines) / elapsed:>10,.0f} commands/s ({baseline / elapsed:.2f}x)")
+            shards *= 2
+
+
+# Head-to-head of the book map engines: random inserts, lookups, 20-book range scans, random deletes, the
+# generated command workload on a bulk-loaded catalog and the memory allocated per book
+def bench_engines(options):
+    books = options.books
+    rng = random.Random(options.seed)
+    insert_order = rng.sample(range(1, books + 1), books)
+    lookups = [rng.randint(1, books) for _ in range(books)]
+    scans = [rng.randint(1, books) for _ in range(books // 10)]
+    deletes = rng.sample(range(1, books + 1), books // 2)
+    commands = [parse_line(line) for line in
+                generate(books, options.operations, options.mix, options.distribution, options.seed)]
+
+    def insert_all(tree):
+        for bookId in insert_order:
+            tree.insert(BookNode(bookId, '"Title"', '"Author"', '"Yes"'))
+
+    def find_all(tree):
+        for bookId in lookups:
+            tree.find(bookId)
+
+    def scan_all(tree):
+        for low in scans:
+            for _ in tree.range_scan(low, low + 19):
+                pass
+
+    def delete_all(tree):
+        for bookId in deletes:
+            tree.delete(bookId)
+
+    def run_workload(library):
+        for comm, args in commands:
+            execute_command(library, comm, args)
+
+    print(f"books={books} commands={len(commands)}")
+    print(f"{'':<18}" + "".join(f"{name:>14}" for name in TREE_ENGINES))
+    rows = {"insert": [], "find": [], "range scan": [], "delete": [], "workload": [], "bytes/book": []}
+    for engine in TREE_ENGINES.values():
+        tree = engine()
+        for name, func, count in (("insert", insert_all, books), ("find", find_all, books),
+                                  ("range scan", scan_all, len(scans)), ("delete", delete_all, len(deletes))):
+            elapsed, _ = timed(func, tree)
+            rows[name].append(count / elapsed)
+        library = LibraryManagementSystem(engine)
+        library.bookTree.bulk_load(make_books(books))
+        elapsed, _ = timed(run_workload, library)
+        rows["workload"].append(len(commands) / elapsed)
+        catalog = make_books(books) # allocated outside the trace, only the engine's own structures are counted
+        tracemalloc.start()
+        engine().bulk_load(catalog)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rows["bytes/book"].append(peak / books)
+    for name, values in rows.items():
+        unit = "" if name == "bytes/book" else " ops/s"
+        print(f"{name + unit:<18}" + "".join(f"{value:>14,.0f}" for value in values))
+
+
+# Mix of the writes interleaved with the scans of bench_persistent
+WRITE_MIX = {"InsertBook": 15, "BorrowBook": 40, "ReturnBook": 30, "DeleteBook": 15}
+
+
+# Read/write interleaving: a reader keeps scanning the whole catalog with PrintBooks while writes are applied.
+# A scan of the mutable red-black tree must end before the next write, so the writes arriving meanwhile stall
+# for the whole scan. A scan of the persistent engine reads its version a chunk at a time between writes, as the
+# server does, so a write waits for one chunk at most. Both read one chunk per write on average.
+def bench_persistent(options):
+    books = options.books
+    writes = [parse_line(line) for line in
+              generate(books, options.operations, WRITE_MIX, options.distribution, options.seed)]
+    clock = time.perf_counter
+
+    def run(engine):
+        library = LibraryManagementSystem(engine)
+        library.bookTree.bulk_load(make_books(books))
+        scans = max_stall = 0
+        scan = None
+        pending = iter(writes)
+        for write in pending:
+            start = clock()
+            if scan is None:
+                scan = library.print_books(1, books * 2)
+            if library.bookTree.versioned:
+                # read one chunk of the version taken at the start of the scan, then let the write through
+                queued = [write]
+                if len(list(islice(scan, SCAN_CHUNK))) < SCAN_CHUNK:
+                    scan = None
+                    scans += 1
+            else:
+                # the scan holds the tree, the writes arriving meanwhile wait for it
+                scanned = sum(1 for _ in scan)
+                scan = None
+                scans += 1
+                queued = [write, *islice(pending, scanned // SCAN_CHUNK)]
+            for comm, args in queued:
+                execute_command(library, comm, args)
+            max_stall = max(max_stall, clock() - start)
+        return scans, max_stall
+
+    print(f"books={books} writes={len(writes)} chunk={SCAN_CHUNK}")
+    for engine in (RedBlackTree, PersistentRedBlackTree):
+        # full cyclic collections over the large trees would dominate the measured stalls
+        gc.disable()
+        try:
+            elapsed, (scans, max_stall) = timed(run, engine)
+        finally:
+            gc.enable()
+        print(f"{engine.__name__:<24} {len(writes) / elapsed:>10,.0f} writes/s {scans:>4} full scans "
+              f"max write stall {max_stall * 1e3:8.2f} ms")
+
+
+# Nightly overdue sweeps: every book is lent with a due time spread over a year, then the clock advances one
+# tick per night. AdvanceClock only visits the loans falling due that night, a sweep without the due-date index
+# walks every book in the tree.
+def bench_loans(options):
+    books = options.books
+    nights = 365
+    rng = random.Random(options.seed)
+    library = LibraryManagementSystem()
+    library.bookTree.bulk_load(make_books(books))
+    for bookId in range(1, books + 1):
+        library.borrow_book(rng.randint(1, 1000), bookId, 1, rng.randint(1, nights))
+
+    def calendar_sweeps():
+        return sum(len(library.advance_clock(night)) for night in range(1, nights + 1))
+
+    # The tree walk is sampled over fewer nights on large catalogs
+    sweep_nights = min(nights, max(1, nights * 10000 // books))
+
+    def tree_sweeps():
+        due = library.loans.due
+        expired = 0
+        for night in range(1, sweep_nights + 1):
+            for node in library.bookTree.range_scan(float("-inf"), float("inf")):
+                if node.val.borrowing_patron is not None and night - 1 <= due[node.val.bookId] < night:
+                    expired += 1
+        return expired
+
+    calendar_time, expired = timed(calendar_sweeps)
+    tree_time, _ = timed(tree_sweeps)
+    print(f"loans={books} nights={nights} expired={expired}")
+    print(f"AdvanceClock sweep: {calendar_time / nights * 1e3:10.3f} ms/night")
+    print(f"tree walk sweep:    {tree_time / sweep_nights * 1e3:10.3f} ms/night")
+
+
+# Ingestion throughput of a generated command log: the text reader used by default against the memory-mapped
+# reader of --mmap, without and with the journaled lines decoded. The traced allocations are the bytes the yielded
+# commands keep per line when they are all held, and the peak while they are streamed one at a time
+def bench_ingest(options):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "commands.txt")
+        with open(path, "w") as command_file:
+            for line in catalog_lines(options.books):
+                command_file.write(f"InsertBook({line})\n")
+            for line in generate(options.books, options.operations, options.mix, options.distribution, options.seed):
+                command_file.write(line + "\n")
+        size = os.path.getsize(path)
+        print(f"lines={options.books + options.operations} size={size / 1e6:.1f} MB")
+        readers = (
+            ("text", lambda: read_commands(open(path))),
+            ("mapped", lambda: mapped_commands(open(path, "rb"))),
+            ("mapped, journaled", lambda: mapped_commands(open(path, "rb"), JOURNALED_COMMANDS)),
+        )
+        lines = options.books + options.operations
+        times = {name: [] for name, _ in readers}
+        for _ in range(3):
+            for name, reader in readers: # alternate the readers so that drift affects them alike
+                times[name].append(timed(lambda: sum(1 for _ in reader()))[0])
+        baseline = min(times["text"])
+        for name, reader in readers:
+            elapsed = min(times[name])
+            tracemalloc.start()
+            commands = list(reader())
+            kept, _ = tracemalloc.get_traced_memory()
+            del commands
+            tracemalloc.reset_peak()
+            sum(1 for _ in reader())
+            _, streaming_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:<18} {size / elapsed / 1e6:8.1f} MB/s ({baseline / elapsed:.2f}x)"
+                  f" {kept / lines:7.1f} bytes/line kept, streaming peak {streaming_peak / 1e6:6.2f} MB")
+
+
+# Zipf distributed lookups with the hot-book cache disabled and at several capacities, and the Zipf circulation
+# workload without and with the default cache, for each book map engine
+def bench_cache(options):
+    books = options.books
+    rng = random.Random(options.seed)
+    sample = zipf_sampler(books, rng)
+    lookups = [sample() for _ in range(options.operations)]
+    commands = [parse_line(line) for line in
+                generate(books, options.operations, CIRCULATION_MIX, "zipf", options.seed)]
+
+    def find_all(library):
+        find = library.find_book
+        for bookId in lookups:
+            find(bookId)
+
+    def run_workload(library):
+        for comm, args in commands:
+            execute_command(library, comm, args)
+
+    print(f"books={books} lookups={len(lookups)} distribution=zipf")
+    def make_library(engine, capacity):
+        library = LibraryManagementSystem(engine, cache_size=capacity)
+        library.bookTree.bulk_load(make_books(books))
+        return library
+
+    for name, engine in TREE_ENGINES.items():
+        baseline, _ = timed(find_all, make_library(engine, 0))
+        print(f"{name}: uncached find {baseline / len(lookups) * 1e6:6.2f} us")
+        for capacity in (BOOK_CACHE_SIZE // 4, BOOK_CACHE_SIZE, BOOK_CACHE_SIZE * 4):
+            library = make_library(engine, capacity)
+            cache = library.bookCache
+            elapsed, _ = timed(find_all, library)
+            print(f"  cache {capacity:>6}: find {elapsed / len(lookups) * 1e6:6.2f} us ({baseline / elapsed:.2f}x), "
+                  f"hit rate {cache.hits / (cache.hits + cache.misses):.1%}")
+        rates = []
+        for capacity in (0, BOOK_CACHE_SIZE):
+            elapsed, _ = timed(run_workload, make_library(engine, capacity))
+            rates.append(len(commands) / elapsed)
+        print(f"  circulation: {rates[0]:,.0f} -> {rates[1]:,.0f} commands/s ({rates[1] / rates[0]:.2f}x)")
+
+
+# Run the workload for each catalog size and report throughput and peak allocation per command type
+def bench_suite(options):
+    report = {
+        "distribution": options.distribution,
+        "operations": options.operations,
+        "mix": options.mix or DEFAULT_MIX,
+        "seed": options.seed,
+        "results": [],
+    }
+    for books in options.sizes:
+        library = LibraryManagementSystem()
+        load_time, _ = timed(library.bookTree.bulk_load, make_books(books))
+        commands = [parse_line(line) for line in
+                    generate(books, options.operations, options.mix, options.distribution, options.seed)]
+
+        # Timing pass
+        elapsed = {}
+        counts = {}
+        clock = time.perf_counter
+        for comm, args in commands:
+            start = clock()
+            execute_command(library, comm, args)
+            elapsed[comm] = elapsed.get(comm, 0.0) + clock() - start
+            counts[comm] = counts.get(comm, 0) + 1
+
+        # Memory pass on a sample of the workload, tracing is too slow for the timing pass. It starts again from a
+        # freshly loaded library, so the sample sees the same state as in the timing pass
+        library = LibraryManagementSystem()
+        library.bookTree.bulk_load(make_books(books))
+        peaks = {}
+        tracemalloc.start()
+        for comm, args in commands[:options.memory_operations]:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            execute_command(library, comm, args)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks[comm] = max(peaks.get(comm, 0), peak - before)
+        tracemalloc.stop()
+
+        result = {
+            "books": books,
+            "bulk_load_seconds": load_time,
+            "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "commands": {
+                comm: {
+                    "count": counts[comm],
+                    "ops_per_sec": counts[comm] / elapsed[comm] if elapsed[comm] else None,
+                    "mean_us": elapsed[comm] / counts[comm] * 1e6,
+                    "peak_alloc_bytes": peaks.get(comm),
+                }
+                for comm in sorted(counts)
+            },
+        }
+        report["results"].append(result)
+        print(f"books={books} bulk_load={load_time:.2f}s peak_rss={result['peak_rss_kib']:,} KiB")
+        for comm, stats in result["commands"].items():
+            print(f"  {comm:<16} {stats['count']:>8} ops {stats['ops_per_sec'] or 0:>12,.0f} ops/s "
+                  f"peak alloc {stats['peak_alloc_bytes'] or 0:>10,} B")
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+        print(f"results saved to {options.json}")
+
+
+BENCHMARKS = {
+    "bulkload": bench_bulk_load,
+    "memory": bench_memory,
+    "journal": bench_journal,
+    "batch": bench_batch,
+    "parse": bench_parse,
+    "render": bench_render,
+    "waitlist": bench_waitlist,
+    "shards": bench_shards,
+    "engines": bench_engines,
+    "persistent": bench_persistent,
+    "loans": bench_loans,
+    "ingest": bench_ingest,
+    "cache": bench_cache,
+    "suite": bench_suite,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GatorLibrary benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--books", type=int, default=100000, help="catalog size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="catalog sizes for the suite, up to 10000000")
+    parser.add_argument("--operations", type=int, default=100000, help="commands per suite run")
+    parser.add_argument("--memory-operations", type=int, default=10000,
+                        help="commands traced for peak allocation per suite run")
+    parser.add_argument("--distribution", choices=("uniform", "zipf"), default="uniform")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="command weights, e.g. BorrowBook=50,ReturnBook=50")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="path", help="save the suite results as JSON")
+    cli_args = parser.parse_args()
+    BENCHMARKS[cli_args.benchmark](cli_args)
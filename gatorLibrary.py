@@ -16,12 +16,28 @@ min-heap to keep track of book reservations made by the patrons
 '''
 
 # Import necessary modules
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import struct
 import sys
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate, chain, islice
+from collections import deque
+from contextlib import closing, nullcontext
 import time
 from os.path import splitext
 
 # Class representing a node in the book tree
 class BookNode:
+    __slots__ = ("bookId", "bookName", "authorName", "isAvailable", "borrowing_patron", "_reservations", "rendered")
+
     def __init__(self, bookId, bookName, authorName, isAvailable):
         # Initialize book node attributes
         self.bookId = bookId
@@ -29,43 +45,93 @@ class BookNode:
         self.authorName = authorName
         self.isAvailable = isAvailable
         self.borrowing_patron = None
-        # Initializing reservations as a binary min heap
-        self.reservations = BinaryMinHeap()
+        # The reservations binary min heap is only created once a patron joins the waitlist
+        self._reservations = None
+        # Cached details block, reset to None whenever the availability, borrower or waitlist changes
+        self.rendered = None
+
+    # Details block of the book as printed by PrintBook, PrintBooks and FindClosestBook, cached until it changes
+    def render(self):
+        if self.rendered is None:
+            self.rendered = (
+                f"BookID = {self.bookId}\n"
+                f"Title = {self.bookName}\n"
+                f"Author = {self.authorName}\n"
+                f"Availability = {self.isAvailable}\n"
+                f"BorrowedBy = {self.borrowing_patron}\n"
+                f"Reservations = {self.reservation_patrons()}"
+            )
+        return self.rendered
+
+    # Reservations waitlist, created on first use as an instance of the waitlist backend class
+    def waitlist(self, backend):
+        if self._reservations is None:
+            self._reservations = backend()
+        return self._reservations
 
-    # Method to get all reservations
+    # Check if any patron is waiting for the book without creating the heap
+    def has_reservations(self):
+        return self._reservations is not None and len(self._reservations) > 0
+
+    # Patron ids in waitlist order, as printed in the book details
+    def reservation_patrons(self):
+        return self.get_reservations()
+
+    # Method to get all reservations in priority order, without modifying the heap
     def get_reservations(self):
-        reservations = []
-        while True:
-            minNode = self.reservations.remove_min()
-            if minNode is not None:
-                patronId = minNode[1]
-                reservations.append(patronId)
-            else:
-                break
-        return reservations # return reservations
+        if self._reservations is None:
+            return []
+        return [reservation[2] for reservation in self._reservations.ordered()]
     
-    # Method to add a reservation to the book node for each book
-    def add_reservation(self, patronId, priorityNumber):
-        timestamp = time.time()
-        # Create a reservation tuple
-        reservation = (priorityNumber, patronId, timestamp)
-         # Insert reservation into the binary min heap
-        self.reservations.insert(reservation)
-
-        # Limiting the number of reservations
-        if len(self.reservations.heap) > 20:
-            # Return message if the reservation limit is reached
+    # Copy of the book, with a copy of its waitlist, that can be changed without affecting this one
+    def copy(self):
+        book = BookNode(self.bookId, self.bookName, self.authorName, self.isAvailable)
+        book.borrowing_patron = self.borrowing_patron
+        if self._reservations is not None:
+            book._reservations = reservations = type(self._reservations)()
+            reservations.load(self._reservations.ordered())
+            reservations.sequence = self._reservations.sequence
+        book.rendered = self.rendered
+        return book
+
+    # Method to add a reservation to the book node for each book, creating its waitlist with backend if needed
+    def add_reservation(self, patronId, priorityNumber, backend):
+        reservations = self.waitlist(backend)
+        # A patron holds at most one reservation per book
+        if patronId in reservations:
+            return "Already reserved"
+        # Limiting the number of reservations to 20, the patron is not added to a full waitlist
+        if len(reservations) >= 20:
             return "Waitlist full"
-    
+        # Insert the reservation into the waitlist, ties in priority are served in reservation order
+        reservations.add(patronId, priorityNumber)
+        self.rendered = None
+
     # Method to remove the reservation with the highest priority
     def remove_reservation(self):
-        return self.reservations.remove_min() if self.reservations.heap else None
+        if not self.has_reservations():
+            return None
+        self.rendered = None
+        return self._reservations.remove_min()
+
+    # Method to cancel the reservation of a patron, None if the patron has none
+    def cancel_reservation(self, patronId):
+        reservation = self._reservations.remove_patron(patronId) if self.has_reservations() else None
+        if reservation is not None:
+            self.rendered = None
+        return reservation
+
+    # Method to get the 1-based waitlist position of a patron, None if the patron has no reservation
+    def waitlist_position(self, patronId):
+        return self._reservations.position(patronId) if self.has_reservations() else None
     
     
     
 
 # Class definition for a node in the Red-Black Tree
 class RedBlackNode:
+    __slots__ = ("val", "red", "parent", "left", "right", "size", "available", "pred", "succ")
+
     #Constructor for RedBlackTree Node
     def __init__(self, val: BookNode):
         self.val = val
@@ -74,8 +140,24 @@ class RedBlackNode:
         self.parent = None
         self.left = None
         self.right = None
-
+        # Number of books and available books in the subtree rooted at this node
+        self.size = 1
+        self.available = 0
+        # In-order predecessor and successor threads, None at either end of the tree
+        self.pred = None
+        self.succ = None
+
+# Maximum number of released nodes kept for reuse by a RedBlackTree
+FREE_LIST_LIMIT = 1 << 16
+
+# Ordered map of the books used by LibraryManagementSystem (the default engine)
+# Engines provide insert, delete, delete_node, find, find_from, floor, ceiling, range_scan, closest, bulk_load,
+# count_range, rank, select, availability_changed, preorder, load_preorder, height and len(). They return entry
+# objects whose val is the BookNode, here the tree nodes themselves, and expose color_flip_count (None if the
+# engine does not count color flips) and versioned (whether the engine also provides version and writable).
 class RedBlackTree:
+    versioned = False
+
     #Constructor for RedBlackTree
     def __init__(self):
         # First Empty node for the tree
@@ -83,42 +165,144 @@ class RedBlackTree:
         self.nil.red = False
         self.nil.left = None
         self.nil.right = None
+        self.nil.size = 0
         self.root = self.nil
         self.color_flip_count = 0  # Initializing the flipCounter for color flips to 0
-
-    # Method to insert a value into the Red-Black Tree
+        self.recolored = None # Original colors of nodes recolored by the delete in progress
+        self.free_nodes = [] # Nodes released by delete, reused by insert
+
+    # Number of books in the tree
+    def __len__(self):
+        return self.root.size
+
+    # Get a node for a value, reusing a released node if one is available
+    def new_node(self, val):
+        if self.free_nodes:
+            node = self.free_nodes.pop()
+            node.val = val
+            node.size = 1
+            return node
+        return RedBlackNode(val)
+
+    # Return a node removed from the tree to the free list
+    def release_node(self, node):
+        node.val = None
+        node.parent = node.left = node.right = node.pred = node.succ = None
+        if len(self.free_nodes) < FREE_LIST_LIMIT:
+            self.free_nodes.append(node)
+
+    # Method to insert a value into the Red-Black Tree, returns the new node or None if the bookId exists
     def insert(self, val):
         #Binary Search Insertion
-        new_node = RedBlackNode(val)
-        # new node must be red
-        new_node.red = True  
-        new_node.parent = None
-        new_node.left = self.nil
-        new_node.right = self.nil
-
         parent = None
         current = self.root
         while current != self.nil:
             parent = current
              # Determine whether to move left or right based on the bookId of the new node
-            if new_node.val.bookId < current.val.bookId:
+            if val.bookId < current.val.bookId:
                 current = current.left
-            elif new_node.val.bookId > current.val.bookId:
+            elif val.bookId > current.val.bookId:
                 current = current.right
             else:
                 return
 
+        new_node = self.new_node(val)
+        # new node must be red
+        new_node.red = True  
+        new_node.left = self.nil
+        new_node.right = self.nil
+        new_node.available = self.is_available(new_node)
+
         # Set the parent and insert the new node
         new_node.parent = parent
         if parent is None:
             self.root = new_node
+            new_node.pred = new_node.succ = None
         elif new_node.val.bookId < parent.val.bookId:
             parent.left = new_node
+            new_node.pred, new_node.succ = parent.pred, parent
         else:
             parent.right = new_node
-
-        # Fix the tree
+            new_node.pred, new_node.succ = parent, parent.succ
+        # Thread the new node between its in-order neighbours
+        if new_node.pred is not None:
+            new_node.pred.succ = new_node
+        if new_node.succ is not None:
+            new_node.succ.pred = new_node
+
+        # Update the subtree counters on the insertion path and fix the tree
+        self.update_counts_upward(parent)
         self.post_insert_rotations(new_node)
+        return new_node
+
+    # Build the tree in linear time from book nodes sorted by bookId, merging with any books already present
+    # Books whose bookId is already in the tree (or repeated in the input) are ignored, as with insert
+    # The result is balanced and deterministically colored: every node is black except those on the
+    # incomplete deepest level, which are red. No color flips are counted.
+    def bulk_load(self, sorted_books):
+        books = list(sorted_books)
+        if any(books[i].bookId > books[i + 1].bookId for i in range(len(books) - 1)):
+            books.sort(key=lambda book: book.bookId) # not pre-sorted
+        if self.root != self.nil:
+            # Merge the new books with the existing ones, existing books take precedence
+            existing = [node.val for node in self.range_scan(float("-inf"), float("inf"))]
+            merged = []
+            i = j = 0
+            while i < len(existing) and j < len(books):
+                if books[j].bookId < existing[i].bookId:
+                    merged.append(books[j])
+                    j += 1
+                else:
+                    if books[j].bookId == existing[i].bookId:
+                        j += 1
+                    merged.append(existing[i])
+                    i += 1
+            merged.extend(existing[i:])
+            merged.extend(books[j:])
+            books = merged
+        # Drop repeated bookIds, keeping the first occurrence
+        unique_books = []
+        for book in books:
+            if not unique_books or unique_books[-1].bookId != book.bookId:
+                unique_books.append(book)
+
+        # Levels 0 .. full_levels - 1 are complete, nodes below them are colored red
+        full_levels = (len(unique_books) + 1).bit_length() - 1
+
+        def build(low, high, depth, parent):
+            if low > high:
+                return self.nil
+            mid = (low + high) // 2
+            node = RedBlackNode(unique_books[mid])
+            node.red = depth >= full_levels
+            node.parent = parent
+            node.left = build(low, mid - 1, depth + 1, node)
+            node.right = build(mid + 1, high, depth + 1, node)
+            node.size = node.left.size + node.right.size + 1
+            node.available = node.left.available + node.right.available + (node.val.isAvailable == '"Yes"')
+            return node
+
+        self.root = build(0, len(unique_books) - 1, 0, None)
+        self.thread()
+        return len(unique_books)
+
+    # Set the predecessor and successor threads of every node with one in-order walk
+    def thread(self):
+        previous = None
+        stack = []
+        node = self.root
+        while stack or node != self.nil:
+            while node != self.nil:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            node.pred = previous
+            if previous is not None:
+                previous.succ = node
+            previous = node
+            node = node.right
+        if previous is not None:
+            previous.succ = None
 
     #Handle each rotation type if required after the insert is complete
     def post_insert_rotations(self, new_node):
@@ -179,21 +363,15 @@ class RedBlackTree:
 
     #Method to delete a node from the red black tree
     def delete(self, val):
-        # Dict_start holds all values of the node colors before the deletion
-        dict_start = {}
-        valList = []
-        node = self.root
-        valList.append(node)
-        while valList:
-            currNode = valList.pop(0)
-            dict_start[currNode.val.bookId] = 1 if currNode.red else 0 # Add value as 1 for red and 0 for black
-            if currNode.left:
-                valList.append(currNode.left)
-            if currNode.right:
-                valList.append(currNode.right)
         z = self.find(val)
         if z is None:
             return
+        self.delete_node(z)
+
+    #Method to delete a node already located in the red black tree
+    def delete_node(self, z):
+        # Original colors of the nodes recolored during this deletion
+        self.recolored = {}
 
         # Deletion logic
         y = z
@@ -206,7 +384,7 @@ class RedBlackTree:
             self.node_transplant(z, z.left)
         else:
             #(print("Here1 - delete"))
-            y = self.minimum(z.right)
+            y = z.succ # minimum of the right subtree
             y_original_color = y.red
             x = y.right
             if y.parent == z:
@@ -220,104 +398,147 @@ class RedBlackTree:
             self.node_transplant(z, y)
             y.left = z.left
             y.left.parent = y
-            y.red = z.red
+            self.recolor(y, z.red)
+
+        # Recompute the subtree counters from the lowest structurally changed node up to the root
+        self.update_counts_upward(x.parent)
 
         if y_original_color == False:
-            self.post_delete_rotations(x,dict_start)
-        else:
-            #Dict_end holds all values of the node colors after the deletion
-            dict_end = {}
-            valList = []
-            node = self.root
-            valList.append(node)
-            while valList:
-                currNode = valList.pop(0)
-                dict_end[currNode.val.bookId] = 1 if currNode.red else 0
-                if currNode.left:
-                    valList.append(currNode.left)
-                if currNode.right:
-                    valList.append(currNode.right)
-            #Calculate the number of nodes that have different values between dict_start and dict_end to get color flips. 
-            colorDiff = {x : dict_start[x] == dict_end[x] for x in dict_start if x in dict_end }
-            flipCounter = 0
-            for diff in colorDiff.values():
-                if diff == False:
-                    flipCounter +=1
-            self.color_flip_count += flipCounter
+            self.post_delete_rotations(x)
+
+        #Count the nodes (other than the deleted one) whose final color differs from their color before the deletion
+        flipCounter = 0
+        for node, original_color in self.recolored.items():
+            if node is not z and node.red != original_color:
+                flipCounter += 1
+        self.color_flip_count += flipCounter
+        self.recolored = None
+        # Unthread the deleted node
+        if z.pred is not None:
+            z.pred.succ = z.succ
+        if z.succ is not None:
+            z.succ.pred = z.pred
+        self.release_node(z)
+
+    #Set the color of a node, remembering its original color during a deletion
+    def recolor(self, node, red):
+        if node.red != red:
+            if node not in self.recolored:
+                self.recolored[node] = node.red
+            node.red = red
 
     #Method that handles rotations in the RBT post deletion
-    def post_delete_rotations(self, x, dict_start):
+    def post_delete_rotations(self, x):
         while x != self.root and x.red == False:
             if x == x.parent.left:
                 w = x.parent.right
                 if w.red:
-                    w.red = False
-                    x.parent.red = True
+                    self.recolor(w, False)
+                    self.recolor(x.parent, True)
                     self.rotateLeft(x.parent)
                     w = x.parent.right
 
                 if w.left.red == False and w.right.red == False:
-                    w.red = True
+                    self.recolor(w, True)
                     x = x.parent
                 else:
                     if w.right.red == False:
-                        w.left.red = False
-                        w.red = True
+                        self.recolor(w.left, False)
+                        self.recolor(w, True)
                         self.rotateRight(w)
                         w = x.parent.right
 
-                    w.red = x.parent.red
-                    x.parent.red = False
-                    w.right.red = False
+                    self.recolor(w, x.parent.red)
+                    self.recolor(x.parent, False)
+                    self.recolor(w.right, False)
                     self.rotateLeft(x.parent)
                     x = self.root
             else:
                 w = x.parent.left
                 if w.red:
-                    w.red = False
-                    x.parent.red = True
+                    self.recolor(w, False)
+                    self.recolor(x.parent, True)
                     self.rotateRight(x.parent)
                     w = x.parent.left
 
                 if w.right.red == False and w.left.red == False:
-                    w.red = True
+                    self.recolor(w, True)
                     x = x.parent
                 else:
                     if w.left.red == False:
-                        w.right.red = False
-                        w.red = True
+                        self.recolor(w.right, False)
+                        self.recolor(w, True)
                         self.rotateLeft(w)
                         w = x.parent.left
                     
-                    w.red = x.parent.red
+                    self.recolor(w, x.parent.red)
 
-                    x.parent.red = False
-                    w.left.red = False
+                    self.recolor(x.parent, False)
+                    self.recolor(w.left, False)
                     self.rotateRight(x.parent)
                     x = self.root
-        x.red = False #reset node to black
+        self.recolor(x, False) #reset node to black
+
+    #Yield the nodes with low <= bookId <= high in order, descending straight to low and following the successor threads
+    #limit caps the number of nodes yielded, after resumes the scan with the first bookId greater than it
+    #The tree must not be modified while the scan is being consumed
+    def range_scan(self, low, high, limit=None, after=None):
+        if after is not None and after >= low:
+            low = after + 1
+        node = self.ceiling(low)
+        count = 0
+        while node is not None and node.val.bookId <= high and (limit is None or count < limit):
+            yield node
+            count += 1
+            node = node.succ
+
+    #Node with the largest bookId <= val, None if there is none
+    def floor(self, val):
+        result = None
+        node = self.root
+        while node != self.nil:
+            if node.val.bookId > val:
+                node = node.left
+            else:
+                result = node
+                node = node.right
+        return result
 
-        #Dict_end holds all values of the node colors after the deletion
-        dict_end = {}
-        valList = []
+    #Node with the smallest bookId >= val, None if there is none
+    def ceiling(self, val):
+        result = None
         node = self.root
-        valList.append(node)
-        while valList:
-            currNode = valList.pop(0)
-            dict_end[currNode.val.bookId] = 1 if currNode.red else 0
-            if currNode.left:
-                valList.append(currNode.left)
-            if currNode.right:
-                valList.append(currNode.right)
-
-        #Calculate the number of nodes that have different values between dict_start and dict_end to get color flips. 
-        colorDiff = {x : dict_start[x] == dict_end[x] for x in dict_start if x in dict_end }
-        flipCounter = 0
-        for diff in colorDiff.values():
-            if diff == False:
-                flipCounter +=1
-        self.color_flip_count += flipCounter
-        #The number of color flipped nodes is stored
+        while node != self.nil:
+            if node.val.bookId < val:
+                node = node.right
+            else:
+                result = node
+                node = node.left
+        return result
+
+    #The k nodes with bookIds nearest to target, in bookId order, found in O(log n + k) by walking the threads
+    #outward from the floor and ceiling of target. Ties in distance go to the lower bookId.
+    def closest(self, target, k):
+        lower = higher = None
+        node = self.root
+        while node != self.nil: #floor (largest bookId <= target) and the next node above it
+            if node.val.bookId <= target:
+                lower = node
+                node = node.right
+            else:
+                higher = node
+                node = node.left
+        below = []
+        above = []
+        while len(below) + len(above) < k and (lower is not None or higher is not None):
+            if higher is None or (lower is not None and target - lower.val.bookId <= higher.val.bookId - target):
+                below.append(lower)
+                lower = lower.pred
+            else:
+                above.append(higher)
+                higher = higher.succ
+        below.reverse()
+        return below + above
 
     #Method that finds a node in the RedBlackTree and checks if it exists
     def find(self, val):
@@ -326,15 +547,38 @@ class RedBlackTree:
         while currNode != self.nil and val != currNode.val.bookId: #iterating through each node
             if val < currNode.val.bookId:
                 currNode = currNode.left
-            elif val:
+            else:
                 currNode = currNode.right
         if currNode == self.nil:
             return None  # Does not exist
         else:
             return currNode # Return the found node
         
+    #Find a node starting from a finger node already in the tree instead of the root, for ascending lookups
+    #Climbs only until the subtree is known to hold val, so nearby keys cost O(log distance)
+    def find_from(self, finger, val):
+        if finger is None:
+            return self.find(val)
+        node = finger
+        if val < node.val.bookId:
+            return self.find(val) # fingers only move forward
+        while node.parent is not None and node.val.bookId != val:
+            if node.parent.val.bookId == val:
+                return node.parent
+            if node == node.parent.left and node.parent.val.bookId > val:
+                break # node's subtree spans finger .. val
+            node = node.parent
+        while node != self.nil and val != node.val.bookId:
+            if val < node.val.bookId:
+                node = node.left
+            else:
+                node = node.right
+        return node if node != self.nil else None
+        
     # rotate right at a given node x
     def rotateRight(self, x):
+        if instrumentation is not None:
+            instrumentation.rotations += 1
         y = x.left
         x.left = y.right
         if y.right != self.nil:
@@ -349,9 +593,14 @@ class RedBlackTree:
             x.parent.left = y
         y.right = x
         x.parent = y
+        # y now roots the subtree x used to root
+        y.size, y.available = x.size, x.available
+        self.update_counts(x)
 
     # rotate left at a given node x
     def rotateLeft(self, x):
+        if instrumentation is not None:
+            instrumentation.rotations += 1
         y = x.right
         x.right = y.left
         if y.left != self.nil:
@@ -366,6 +615,9 @@ class RedBlackTree:
             x.parent.right = y
         y.left = x
         x.parent = y
+        # y now roots the subtree x used to root
+        y.size, y.available = x.size, x.available
+        self.update_counts(x)
  
     # Helper Method for facilitating swapping of two subtrees rooted at x and y
     def node_transplant(self, x, y):
@@ -376,56 +628,969 @@ class RedBlackTree:
         else:
             x.parent.right = y
         y.parent = x.parent
-    #Helper method for finding the min value node in the tree
-    def minimum(self, x):
-        while x.left != self.nil:
-            x = x.left #min value is always to the left subtree
+    # Returns 1 if the book held by the node can be borrowed, 0 otherwise
+    def is_available(self, node):
+        return 1 if node.val.isAvailable == '"Yes"' else 0
+
+    # Recompute the subtree counters of a node from its children
+    def update_counts(self, node):
+        node.size = node.left.size + node.right.size + 1
+        node.available = node.left.available + node.right.available + self.is_available(node)
+
+    # Recompute the subtree counters of a node and all of its ancestors
+    def update_counts_upward(self, node):
+        while node is not None:
+            self.update_counts(node)
+            node = node.parent
+
+    # Engine interface: the availability of a book changed
+    availability_changed = update_counts_upward
+
+    # Number of books and available books with bookId <= val
+    def count_upto(self, val):
+        books = available = 0
+        node = self.root
+        while node != self.nil:
+            if node.val.bookId <= val:
+                books += node.left.size + 1
+                available += node.left.available + self.is_available(node)
+                node = node.right
+            else:
+                node = node.left
+        return books, available
+
+    # Number of books and available books with low <= bookId <= high
+    def count_range(self, low, high):
+        if low > high:
+            return 0, 0
+        high_books, high_available = self.count_upto(high)
+        low_books, low_available = self.count_upto(low - 1)
+        return high_books - low_books, high_available - low_available
+
+    # 1-based position of a book in bookId order, None if it does not exist
+    def rank(self, val):
+        if self.find(val) is None:
+            return None
+        return self.count_upto(int(val))[0]
+
+    # Node holding the k-th smallest bookId (1-based), None if k is out of range
+    def select(self, k):
+        node = self.root
+        while node != self.nil:
+            left_size = node.left.size
+            if k <= left_size:
+                node = node.left
+            elif k == left_size + 1:
+                return node
+            else:
+                k -= left_size + 1
+                node = node.right
+        return None
+
+    #Height of the tree (number of nodes on the longest root-to-leaf path), computed with an iterative walk
+    def height(self):
+        height = 0
+        stack = [(self.root, 1)] if self.root != self.nil else []
+        while stack:
+            node, depth = stack.pop()
+            height = max(height, depth)
+            if node.left != self.nil:
+                stack.append((node.left, depth + 1))
+            if node.right != self.nil:
+                stack.append((node.right, depth + 1))
+        return height
+
+    #Yield (node, snapshot flags) in pre-order, the flags giving the color and which children exist
+    def preorder(self):
+        stack = [self.root] if self.root != self.nil else []
+        while stack:
+            node = stack.pop()
+            yield node, ((SNAPSHOT_RED if node.red else 0) |
+                         (SNAPSHOT_LEFT if node.left != self.nil else 0) |
+                         (SNAPSHOT_RIGHT if node.right != self.nil else 0))
+            if node.right != self.nil:
+                stack.append(node.right)
+            if node.left != self.nil:
+                stack.append(node.left)
+
+    #Replace the contents with the exact tree described by (snapshot flags, book) records in pre-order
+    def load_preorder(self, records):
+        # Read the next record and its subtrees; the recursion depth is the tree height
+        def read_subtree(parent):
+            flags, book = next(records)
+            node = RedBlackNode(book)
+            node.red = bool(flags & SNAPSHOT_RED)
+            node.parent = parent
+            node.left = read_subtree(node) if flags & SNAPSHOT_LEFT else self.nil
+            node.right = read_subtree(node) if flags & SNAPSHOT_RIGHT else self.nil
+            self.update_counts(node)
+            return node
+
+        self.root = self.nil
+        for first in records:
+            records = chain((first,), records)
+            self.root = read_subtree(None)
+            self.thread()
+            break
+
+
+
+# Entries per chunk of a SortedChunkMap: chunks split above twice this size and merge below half of it
+CHUNK_LOAD = 256
+
+# Entry of a SortedChunkMap, the counterpart of a RedBlackNode
+class ChunkEntry:
+    __slots__ = ("val",)
+
+    def __init__(self, val):
+        self.val = val
+
+
+# Ordered map engine on a list of sorted chunks: one level of index (the largest bookId of each chunk) over wide
+# leaves holding flat lists of int keys. A lookup is two C-level bisects instead of a walk through log2(n) node
+# objects. Available counts per chunk and the prefix sums used by count_range, rank and select are cached and
+# recomputed lazily after changes. Provides the same interface as RedBlackTree, without color flips.
+class SortedChunkMap:
+    color_flip_count = None # only the red-black engine counts color flips
+    versioned = False
+
+    def __init__(self):
+        self.keys = [] # sorted bookIds of each chunk
+        self.chunks = [] # ChunkEntry objects of each chunk, parallel to keys
+        self.maxes = [] # largest bookId of each chunk
+        self.chunk_available = [] # available books of each chunk, None when it must be recounted
+        self.offsets = None # number of books before each chunk, None when stale
+        self.available_offsets = None # number of available books before each chunk, None when stale
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    # Chunk and slot of the first bookId >= val; the chunk is len(chunks) past the end
+    def locate(self, val):
+        i = bisect_left(self.maxes, val)
+        if i == len(self.maxes):
+            return i, 0
+        return i, bisect_left(self.keys[i], val)
+
+    # Chunk and slot of the first bookId > val
+    def locate_right(self, val):
+        i = bisect_right(self.maxes, val)
+        if i == len(self.maxes):
+            return i, 0
+        return i, bisect_right(self.keys[i], val)
+
+    def find(self, val):
+        val = int(val)
+        i = bisect_left(self.maxes, val)
+        if i == len(self.maxes):
+            return None
+        keys = self.keys[i]
+        j = bisect_left(keys, val)
+        return self.chunks[i][j] if keys[j] == val else None
+
+    # Lookups are already cheap, the finger is not used
+    def find_from(self, finger, val):
+        return self.find(val)
+
+    # Insert a book, returns the new entry or None if the bookId exists
+    def insert(self, val):
+        bookId = val.bookId
+        entry = ChunkEntry(val)
+        available = val.isAvailable == '"Yes"'
+        if not self.maxes:
+            self.keys.append([bookId])
+            self.chunks.append([entry])
+            self.maxes.append(bookId)
+            self.chunk_available.append(int(available))
+        else:
+            i = bisect_left(self.maxes, bookId)
+            if i == len(self.maxes):
+                i -= 1 # new largest bookId, append to the last chunk
+                self.maxes[i] = bookId
+                j = len(self.keys[i])
+            else:
+                j = bisect_left(self.keys[i], bookId)
+                if self.keys[i][j] == bookId:
+                    return None
+            self.keys[i].insert(j, bookId)
+            self.chunks[i].insert(j, entry)
+            if self.chunk_available[i] is not None:
+                self.chunk_available[i] += available
+            if len(self.keys[i]) > 2 * CHUNK_LOAD:
+                self.split(i)
+        self.count += 1
+        self.offsets = self.available_offsets = None
+        return entry
+
+    # Split an oversized chunk in two
+    def split(self, i):
+        half = len(self.keys[i]) // 2
+        self.keys.insert(i + 1, self.keys[i][half:])
+        self.chunks.insert(i + 1, self.chunks[i][half:])
+        del self.keys[i][half:]
+        del self.chunks[i][half:]
+        self.maxes.insert(i, self.keys[i][-1])
+        self.chunk_available[i:i + 1] = [None, None]
+
+    def delete(self, val):
+        entry = self.find(val)
+        if entry is not None:
+            self.delete_node(entry)
+
+    def delete_node(self, entry):
+        i, j = self.locate(entry.val.bookId)
+        del self.keys[i][j]
+        del self.chunks[i][j]
+        if self.chunk_available[i] is not None:
+            self.chunk_available[i] -= entry.val.isAvailable == '"Yes"'
+        if not self.keys[i]:
+            del self.keys[i], self.chunks[i], self.maxes[i], self.chunk_available[i]
+        else:
+            self.maxes[i] = self.keys[i][-1]
+            if len(self.keys[i]) < CHUNK_LOAD // 2 and len(self.keys) > 1:
+                # Merge the small chunk into a neighbour, splitting again if the result is too large
+                if i == len(self.keys) - 1:
+                    i -= 1
+                self.keys[i].extend(self.keys.pop(i + 1))
+                self.chunks[i].extend(self.chunks.pop(i + 1))
+                del self.maxes[i]
+                self.chunk_available[i:i + 2] = [None]
+                if len(self.keys[i]) > 2 * CHUNK_LOAD:
+                    self.split(i)
+        self.count -= 1
+        self.offsets = self.available_offsets = None
+
+    # The availability of a book changed: its chunk is recounted when next needed
+    def availability_changed(self, entry):
+        self.chunk_available[bisect_left(self.maxes, entry.val.bookId)] = None
+        self.available_offsets = None
+
+    def floor(self, val):
+        i, j = self.locate_right(val)
+        if j > 0:
+            return self.chunks[i][j - 1]
+        return self.chunks[i - 1][-1] if i > 0 else None
+
+    def ceiling(self, val):
+        i, j = self.locate(val)
+        return self.chunks[i][j] if i < len(self.chunks) else None
+
+    # Yield the entries with low <= bookId <= high in order; limit and after page the scan as in RedBlackTree
+    def range_scan(self, low, high, limit=None, after=None):
+        if after is not None and after >= low:
+            low = after + 1
+        i, j = self.locate(low)
+        count = 0
+        while i < len(self.chunks):
+            keys = self.keys[i]
+            stop = bisect_right(keys, high, j)
+            if limit is not None:
+                stop = min(stop, j + limit - count)
+            yield from self.chunks[i][j:stop]
+            count += stop - j
+            if stop < len(keys) or (limit is not None and count >= limit):
+                return
+            i += 1
+            j = 0
+
+    # The k entries nearest to target in bookId order, walking outward from the floor; ties go to the lower bookId
+    def closest(self, target, k):
+        keys = self.keys
+        hi_i, hi_j = self.locate_right(target)
+        lo_i, lo_j = hi_i, hi_j - 1
+        if lo_j < 0:
+            lo_i -= 1
+            lo_j = len(keys[lo_i]) - 1 if lo_i >= 0 else -1
+        below = []
+        above = []
+        while len(below) + len(above) < k:
+            has_lower, has_higher = lo_i >= 0, hi_i < len(keys)
+            if not has_lower and not has_higher:
+                break
+            if not has_higher or (has_lower and target - keys[lo_i][lo_j] <= keys[hi_i][hi_j] - target):
+                below.append(self.chunks[lo_i][lo_j])
+                lo_j -= 1
+                if lo_j < 0:
+                    lo_i -= 1
+                    lo_j = len(keys[lo_i]) - 1 if lo_i >= 0 else -1
+            else:
+                above.append(self.chunks[hi_i][hi_j])
+                hi_j += 1
+                if hi_j == len(keys[hi_i]):
+                    hi_i += 1
+                    hi_j = 0
+        below.reverse()
+        return below + above
+
+    # Build from book nodes, merging with any books already present; existing and first occurrences win
+    def bulk_load(self, sorted_books):
+        books = list(sorted_books)
+        if any(books[i].bookId > books[i + 1].bookId for i in range(len(books) - 1)):
+            books.sort(key=lambda book: book.bookId) # not pre-sorted
+        existing = [entry.val for chunk in self.chunks for entry in chunk]
+        if existing:
+            # Stable sort keeps the existing books ahead of new ones with the same bookId
+            books = sorted(existing + books, key=lambda book: book.bookId)
+        unique_books = []
+        for book in books:
+            if not unique_books or unique_books[-1].bookId != book.bookId:
+                unique_books.append(book)
+        self.keys = [[book.bookId for book in unique_books[start:start + CHUNK_LOAD]]
+                     for start in range(0, len(unique_books), CHUNK_LOAD)]
+        self.chunks = [[ChunkEntry(book) for book in unique_books[start:start + CHUNK_LOAD]]
+                       for start in range(0, len(unique_books), CHUNK_LOAD)]
+        self.maxes = [keys[-1] for keys in self.keys]
+        self.chunk_available = [None] * len(self.keys)
+        self.count = len(unique_books)
+        self.offsets = self.available_offsets = None
+        return len(unique_books)
+
+    # Refresh the cached prefix sums
+    def prefix_sums(self):
+        if self.offsets is None:
+            self.offsets = list(accumulate(map(len, self.keys), initial=0))
+        if self.available_offsets is None:
+            for i, available in enumerate(self.chunk_available):
+                if available is None:
+                    self.chunk_available[i] = sum(entry.val.isAvailable == '"Yes"' for entry in self.chunks[i])
+            self.available_offsets = list(accumulate(self.chunk_available, initial=0))
+
+    # Number of books and available books before a (chunk, slot) position
+    def count_before(self, i, j):
+        books = self.offsets[i] + j
+        available = self.available_offsets[i]
+        if j:
+            available += sum(entry.val.isAvailable == '"Yes"' for entry in self.chunks[i][:j])
+        return books, available
+
+    def count_range(self, low, high):
+        if low > high:
+            return 0, 0
+        self.prefix_sums()
+        high_books, high_available = self.count_before(*self.locate_right(high))
+        low_books, low_available = self.count_before(*self.locate(low))
+        return high_books - low_books, high_available - low_available
+
+    def rank(self, val):
+        if self.find(val) is None:
+            return None
+        self.prefix_sums()
+        i, j = self.locate(int(val))
+        return self.offsets[i] + j + 1
+
+    def select(self, k):
+        if not 1 <= k <= self.count:
+            return None
+        self.prefix_sums()
+        i = bisect_right(self.offsets, k - 1) - 1
+        return self.chunks[i][k - 1 - self.offsets[i]]
+
+    # Levels of the structure: the chunk index and the chunks
+    def height(self):
+        return 2 if self.count else 0
+
+    # Yield (entry, snapshot flags) in the pre-order of a balanced red-black tree over the books, colored as by
+    # RedBlackTree.bulk_load, so that snapshots can be restored by either engine
+    def preorder(self):
+        entries = [entry for chunk in self.chunks for entry in chunk]
+        full_levels = (len(entries) + 1).bit_length() - 1
+        stack = [(0, len(entries) - 1, 0)] if entries else []
+        while stack:
+            low, high, depth = stack.pop()
+            mid = (low + high) // 2
+            yield entries[mid], ((SNAPSHOT_RED if depth >= full_levels else 0) |
+                                 (SNAPSHOT_LEFT if low < mid else 0) |
+                                 (SNAPSHOT_RIGHT if mid < high else 0))
+            if mid < high:
+                stack.append((mid + 1, high, depth + 1))
+            if low < mid:
+                stack.append((low, mid - 1, depth + 1))
+
+    # Replace the contents with the books of (snapshot flags, book) records, ignoring the tree shape
+    def load_preorder(self, records):
+        self.keys, self.chunks, self.maxes, self.chunk_available, self.count = [], [], [], [], 0
+        self.bulk_load(book for _, book in records)
+
+
+# Node of a PersistentRedBlackTree, None standing for an empty subtree. Nodes and books reachable from a version
+# handle are never changed: a node is changed in place only if it was created after the latest version was taken
+# (its generation is the tree's), and its book only if the book was copied or created since then.
+class PersistentNode:
+    __slots__ = ("val", "red", "left", "right", "size", "available", "generation", "book_generation")
+
+    def __init__(self, val, generation):
+        self.val = val
+        self.red = True
+        self.left = None
+        self.right = None
+        # Number of books and available books in the subtree rooted at this node
+        self.size = 1
+        self.available = 1 if val.isAvailable == '"Yes"' else 0
+        self.generation = generation
+        self.book_generation = generation
+
+    # Copy of the node for the given generation, sharing the children and the book
+    def copy(self, generation):
+        node = PersistentNode.__new__(PersistentNode)
+        node.val = self.val
+        node.red = self.red
+        node.left = self.left
+        node.right = self.right
+        node.size = self.size
+        node.available = self.available
+        node.generation = generation
+        node.book_generation = self.book_generation
+        return node
+
+
+# Immutable point-in-time view of a PersistentRedBlackTree, taken in O(1) by version(). It answers the read
+# queries of the engine interface, and its scans stay consistent while the tree keeps changing.
+class TreeVersion:
+    __slots__ = ("root",)
+
+    def __init__(self, root):
+        self.root = root
+
+    def __len__(self):
+        return self.root.size if self.root is not None else 0
+
+    def find(self, val):
+        val = int(val)
+        node = self.root
+        while node is not None:
+            bookId = node.val.bookId
+            if val < bookId:
+                node = node.left
+            elif val > bookId:
+                node = node.right
+            else:
+                return node
+        return None
+
+    def floor(self, val):
+        result = None
+        node = self.root
+        while node is not None:
+            if node.val.bookId > val:
+                node = node.left
+            else:
+                result = node
+                node = node.right
+        return result
+
+    def ceiling(self, val):
+        result = None
+        node = self.root
+        while node is not None:
+            if node.val.bookId < val:
+                node = node.right
+            else:
+                result = node
+                node = node.left
+        return result
+
+    # Yield the nodes with bookId >= low in ascending order, with a stack of the pending ancestors
+    def ascending(self, low):
+        stack = []
+        node = self.root
+        while node is not None:
+            if node.val.bookId < low:
+                node = node.right
+            else:
+                stack.append(node)
+                node = node.left
+        while stack:
+            node = stack.pop()
+            yield node
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    # Yield the nodes with bookId <= high in descending order
+    def descending(self, high):
+        stack = []
+        node = self.root
+        while node is not None:
+            if node.val.bookId > high:
+                node = node.left
+            else:
+                stack.append(node)
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node
+            node = node.left
+            while node is not None:
+                stack.append(node)
+                node = node.right
+
+    # Yield the nodes with low <= bookId <= high in order; limit and after page the scan as in RedBlackTree
+    def range_scan(self, low, high, limit=None, after=None):
+        if after is not None and after >= low:
+            low = after + 1
+        count = 0
+        for node in self.ascending(low):
+            if node.val.bookId > high or (limit is not None and count >= limit):
+                return
+            yield node
+            count += 1
+
+    # The k nodes nearest to target in bookId order, walking outward from it; ties go to the lower bookId
+    def closest(self, target, k):
+        lower_nodes = self.descending(target)
+        higher_nodes = self.ascending(target)
+        lower = next(lower_nodes, None)
+        higher = next(higher_nodes, None)
+        if higher is not None and higher.val.bookId == target:
+            higher = next(higher_nodes, None) # the target itself is the floor
+        below = []
+        above = []
+        while len(below) + len(above) < k and (lower is not None or higher is not None):
+            if higher is None or (lower is not None and target - lower.val.bookId <= higher.val.bookId - target):
+                below.append(lower)
+                lower = next(lower_nodes, None)
+            else:
+                above.append(higher)
+                higher = next(higher_nodes, None)
+        below.reverse()
+        return below + above
+
+    # Number of books and available books with bookId <= val
+    def count_upto(self, val):
+        books = available = 0
+        node = self.root
+        while node is not None:
+            if node.val.bookId <= val:
+                left = node.left
+                if left is not None:
+                    books += left.size
+                    available += left.available
+                books += 1
+                available += node.val.isAvailable == '"Yes"'
+                node = node.right
+            else:
+                node = node.left
+        return books, available
+
+    def count_range(self, low, high):
+        if low > high:
+            return 0, 0
+        high_books, high_available = self.count_upto(high)
+        low_books, low_available = self.count_upto(low - 1)
+        return high_books - low_books, high_available - low_available
+
+    def rank(self, val):
+        if self.find(val) is None:
+            return None
+        return self.count_upto(int(val))[0]
+
+    def select(self, k):
+        node = self.root
+        while node is not None:
+            left_size = node.left.size if node.left is not None else 0
+            if k <= left_size:
+                node = node.left
+            elif k == left_size + 1:
+                return node
+            else:
+                k -= left_size + 1
+                node = node.right
+        return None
+
+    def height(self):
+        height = 0
+        stack = [(self.root, 1)] if self.root is not None else []
+        while stack:
+            node, depth = stack.pop()
+            height = max(height, depth)
+            if node.left is not None:
+                stack.append((node.left, depth + 1))
+            if node.right is not None:
+                stack.append((node.right, depth + 1))
+        return height
+
+    # Yield (node, snapshot flags) in pre-order; a left-leaning red-black tree is a valid red-black tree, so the
+    # snapshot can be restored with its exact shape by the red-black engine
+    def preorder(self):
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            yield node, ((SNAPSHOT_RED if node.red else 0) |
+                         (SNAPSHOT_LEFT if node.left is not None else 0) |
+                         (SNAPSHOT_RIGHT if node.right is not None else 0))
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+
+
+# Ordered map engine on a persistent left-leaning red-black tree. version() returns an O(1) immutable TreeVersion
+# handle; the changes made after it copy only the nodes on their root-to-leaf paths, and writable() copies the book
+# itself before the library changes it, so a reader can scan a version while writes continue. Nodes created since
+# the latest version are changed in place, so without readers the tree does no copying at all.
+# Provides the same interface as RedBlackTree, without color flips, plus version() and writable().
+class PersistentRedBlackTree(TreeVersion):
+    __slots__ = ("generation",)
+    color_flip_count = None # only the red-black engine counts color flips
+    versioned = True
+
+    def __init__(self):
+        super().__init__(None)
+        self.generation = 0 # bumped by version(), nodes of older generations are shared with a version
+
+    # O(1) immutable handle on the current contents
+    def version(self):
+        self.generation += 1
+        return TreeVersion(self.root)
+
+    # The node itself if it may be changed in place, else a copy of it for the current generation
+    def own(self, node):
+        return node if node.generation == self.generation else node.copy(self.generation)
+
+    # Lookups start from the root, the finger is not used
+    def find_from(self, finger, val):
+        return self.find(val)
+
+    # Copy the path from the root to the node of bookId, which must exist, and return the copied nodes
+    def own_path(self, bookId):
+        node = self.root = self.own(self.root)
+        path = [node]
+        while node.val.bookId != bookId:
+            if bookId < node.val.bookId:
+                node.left = node = self.own(node.left)
+            else:
+                node.right = node = self.own(node.right)
+            path.append(node)
+        return path
+
+    # Entry of a book about to be changed in place: the path and the book are copied unless no version shares them
+    def writable(self, entry):
+        node = self.own_path(entry.val.bookId)[-1]
+        if node.book_generation != self.generation:
+            node.val = node.val.copy()
+            node.book_generation = self.generation
+        return node
+
+    # The availability of a book changed: recount the available books on its path
+    def availability_changed(self, entry):
+        for node in reversed(self.own_path(entry.val.bookId)):
+            self.update_counts(node)
+
+    # Insert a book, returns the new node or None if the bookId exists
+    def insert(self, val):
+        if self.find(val.bookId) is not None:
+            return None
+        root = self.insert_into(self.root, val)
+        root.red = False
+        self.root = root
+        return self.find(val.bookId) # rotations may have copied the new node
+
+    def delete(self, val):
+        entry = self.find(val)
+        if entry is not None:
+            self.delete_node(entry)
+
+    def delete_node(self, entry):
+        bookId = entry.val.bookId
+        root = self.own(self.root)
+        if not self.is_red(root.left) and not self.is_red(root.right):
+            root.red = True
+        root = self.delete_from(root, bookId)
+        if root is not None:
+            root.red = False
+        self.root = root
+
+    @staticmethod
+    def is_red(node):
+        return node is not None and node.red
+
+    @staticmethod
+    def update_counts(node):
+        left, right = node.left, node.right
+        node.size = (left.size if left is not None else 0) + (right.size if right is not None else 0) + 1
+        node.available = ((left.available if left is not None else 0) + (right.available if right is not None else 0)
+                          + (node.val.isAvailable == '"Yes"'))
+
+    # Rotations and color flips work on owned nodes only
+    def rotate_left(self, h):
+        x = self.own(h.right)
+        h.right = x.left
+        x.left = h
+        x.red = h.red
+        h.red = True
+        self.update_counts(h)
+        self.update_counts(x)
         return x
 
+    def rotate_right(self, h):
+        x = self.own(h.left)
+        h.left = x.right
+        x.right = h
+        x.red = h.red
+        h.red = True
+        self.update_counts(h)
+        self.update_counts(x)
+        return x
+
+    def flip_colors(self, h):
+        h.red = not h.red
+        h.left = left = self.own(h.left)
+        left.red = not left.red
+        h.right = right = self.own(h.right)
+        right.red = not right.red
+
+    # Restore the left-leaning invariants on the way up
+    def balance(self, h):
+        if self.is_red(h.right) and not self.is_red(h.left):
+            h = self.rotate_left(h)
+        if self.is_red(h.left) and self.is_red(h.left.left):
+            h = self.rotate_right(h)
+        if self.is_red(h.left) and self.is_red(h.right):
+            self.flip_colors(h)
+        self.update_counts(h)
+        return h
+
+    def insert_into(self, h, val):
+        if h is None:
+            return PersistentNode(val, self.generation)
+        h = self.own(h)
+        if val.bookId < h.val.bookId:
+            h.left = self.insert_into(h.left, val)
+        else:
+            h.right = self.insert_into(h.right, val)
+        return self.balance(h)
+
+    # h is owned; make its left child or left grandchild red before descending left
+    def move_red_left(self, h):
+        self.flip_colors(h)
+        if self.is_red(h.right.left):
+            h.right = self.rotate_right(h.right)
+            h = self.rotate_left(h)
+            self.flip_colors(h)
+        return h
+
+    # h is owned; make its right child or right grandchild red before descending right
+    def move_red_right(self, h):
+        self.flip_colors(h)
+        if self.is_red(h.left.left):
+            h = self.rotate_right(h)
+            self.flip_colors(h)
+        return h
+
+    # Delete the minimum of the subtree rooted at the owned node h
+    def delete_min(self, h):
+        if h.left is None:
+            return None
+        if not self.is_red(h.left) and not self.is_red(h.left.left):
+            h = self.move_red_left(h)
+        h.left = self.delete_min(self.own(h.left))
+        return self.balance(h)
+
+    # Delete bookId from the subtree rooted at the owned node h
+    def delete_from(self, h, bookId):
+        if bookId < h.val.bookId:
+            if not self.is_red(h.left) and not self.is_red(h.left.left):
+                h = self.move_red_left(h)
+            h.left = self.delete_from(self.own(h.left), bookId)
+        else:
+            if self.is_red(h.left):
+                h = self.rotate_right(h)
+            if bookId == h.val.bookId and h.right is None:
+                return None
+            if not self.is_red(h.right) and not self.is_red(h.right.left):
+                h = self.move_red_right(h)
+            if bookId == h.val.bookId:
+                # Move the successor's book here and delete the successor
+                successor = h.right
+                while successor.left is not None:
+                    successor = successor.left
+                h.val = successor.val
+                h.book_generation = successor.book_generation
+                h.right = self.delete_min(self.own(h.right))
+            else:
+                h.right = self.delete_from(self.own(h.right), bookId)
+        return self.balance(h)
+
+    # Build the tree in linear time from book nodes sorted by bookId, merging with any books already present as
+    # RedBlackTree.bulk_load does. The books are laid out as a 2-3 tree of the largest black height that fits
+    # them, mostly 2-nodes, with the 3-nodes as red left children.
+    def bulk_load(self, sorted_books):
+        books = list(sorted_books)
+        if any(books[i].bookId > books[i + 1].bookId for i in range(len(books) - 1)):
+            books.sort(key=lambda book: book.bookId) # not pre-sorted
+        # Books already in the tree may be shared with a version, the first change copies them
+        book_generation = self.generation if self.root is None else -1
+        if self.root is not None:
+            # Stable sort keeps the existing books ahead of new ones with the same bookId
+            books = sorted([node.val for node in self.ascending(float("-inf"))] + books, key=lambda book: book.bookId)
+        unique_books = []
+        for book in books:
+            if not unique_books or unique_books[-1].bookId != book.bookId:
+                unique_books.append(book)
+        generation = self.generation
+
+        def new_node(i, red, left, right):
+            node = PersistentNode(unique_books[i], generation)
+            node.red = red
+            node.left = left
+            node.right = right
+            node.book_generation = book_generation
+            self.update_counts(node)
+            return node
+
+        # Subtree of the books low .. high - 1 with the given black height; it holds 2**height - 1 to
+        # 3**height - 1 books
+        def build(low, high, height):
+            count = high - low
+            if count == 0:
+                return None
+            if count <= 2 * 3 ** (height - 1) - 1:
+                mid = low + (count - 1) // 2 # 2-node
+                return new_node(mid, False, build(low, mid, height - 1), build(mid + 1, high, height - 1))
+            first = low + (count - 2) // 3 # 3-node: a red left child holds the first of its two books
+            second = first + 1 + (high - first - 2) // 2
+            left = new_node(first, True, build(low, first, height - 1), build(first + 1, second, height - 1))
+            return new_node(second, False, left, build(second + 1, high, height - 1))
+
+        self.root = build(0, len(unique_books), (len(unique_books) + 1).bit_length() - 1)
+        return len(unique_books)
+
+    # Replace the contents with the books of (snapshot flags, book) records, ignoring the tree shape
+    def load_preorder(self, records):
+        self.root = None
+        self.bulk_load(book for _, book in records)
+
+
+# Book map engines selectable with --engine
+TREE_ENGINES = {
+    "rb": RedBlackTree,
+    "chunked": SortedChunkMap,
+    "persistent": PersistentRedBlackTree,
+}
+# Engine of a library unless another one is given
+DEFAULT_ENGINE = RedBlackTree
 
 
 class ReservationNode:
+    __slots__ = ("patronId", "priority", "reservationTime")
+
     # Constructor to initialize a reservation node 
     def __init__(self, patronId, priorityNumber, reservationTime):
         self.patronId = patronId
         self.priority = priorityNumber
         self.reservationTime = reservationTime # Timestamp when reservation was made 
 
+# Base class of the waitlist priority queues
+# Entries are (priorityNumber, sequence, patronId) tuples: the lowest priority number is served first and ties are
+# served in reservation order using a monotonic per-waitlist sequence counter, so entries compare as plain tuples.
+# Every backend provides add, insert, load, remove_min, remove_patron, position and ordered, len(), membership
+# by patronId and iteration over its entries in storage order.
+class Waitlist:
+    __slots__ = ("sequence",)
+    counts_swaps = False # whether the backend reports its swaps to the instrumentation
+
+    def __init__(self):
+        self.sequence = 0 # sequence number of the next reservation
+
+    # Add a reservation for a patron, returns its entry
+    def add(self, patronId, priorityNumber):
+        entry = (priorityNumber, self.sequence, patronId)
+        self.sequence += 1
+        self.insert(entry)
+        return entry
+
+    # Continue the sequence after the entries of a loaded waitlist
+    def resume_sequence(self, elements):
+        self.sequence = max((element[1] for element in elements), default=-1) + 1
+
+    #Entries in priority order, without modifying the waitlist
+    def ordered(self):
+        return sorted(self)
+
+
 # Class that implements the Binary Min Heap
-class BinaryMinHeap:
+# The heap is indexed: index maps each patronId to the slot of its entry, so a patron's
+# reservation can be found, cancelled or ranked without scanning the heap.
+class BinaryMinHeap(Waitlist):
+    __slots__ = ("heap", "index")
+    arity = 2 # children per node
+    counts_swaps = True
+
     #Constructor
     def __init__(self):
+        super().__init__()
         self.heap = []
+        self.index = {} # patronId -> slot in heap
 
     def __iter__(self):
         return iter(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, patronId):
+        return patronId in self.index
+
+    # Replace the contents of the heap with the given entries, which must be in heap order (priority order is)
+    def load(self, elements):
+        self.heap = list(elements)
+        self.index = {element[2]: idx for idx, element in enumerate(self.heap)}
+        self.resume_sequence(self.heap)
     
     #Insert an element into the element
     def insert(self, element):
         self.heap.append(element)
+        self.index[element[2]] = len(self.heap) - 1
         self.heapify_up(len(self.heap) - 1)
 
     #Remove top element from the heap
     def pop(self):
-        if not self.heap:
-            return None
-        if len(self.heap) == 1:
-            return self.heap.pop()
-        top = self.heap[0]
-        self.heap[0] = self.heap.pop()
-        self.heapify_down()
-        return top
+        return self.remove_min()
     
     #Remove minimum element from the heap
     def remove_min(self):
         if not self.heap:
             return None
-        min_element = self.heap[0]
+        return self.remove_at(0)
+
+    #Remove the entry of a patron, None if the patron is not in the heap
+    def remove_patron(self, patronId):
+        idx = self.index.get(patronId)
+        if idx is None:
+            return None
+        return self.remove_at(idx)
+
+    #Remove the entry at a slot, moving the last entry into its place
+    def remove_at(self, idx):
+        element = self.heap[idx]
         last_element = self.heap.pop()
-        if self.heap:
-            self.heap[0] = last_element
-            self.heapify_down()
-        return min_element
+        del self.index[element[2]]
+        if idx < len(self.heap):
+            self.heap[idx] = last_element
+            self.index[last_element[2]] = idx
+            self.heapify_up(idx)
+            self.heapify_down(self.index[last_element[2]])
+        return element
+
+    #1-based position of a patron in priority order, None if the patron is not in the heap
+    #Only the entries ahead of the patron are visited: a subtree is skipped as soon as its root is not ahead
+    def position(self, patronId):
+        idx = self.index.get(patronId)
+        if idx is None:
+            return None
+        heap = self.heap
+        target = heap[idx]
+        arity = self.arity
+        ahead = 0
+        stack = [0]
+        while stack:
+            curr_idx = stack.pop()
+            if curr_idx < len(heap) and heap[curr_idx] < target:
+                ahead += 1
+                stack.extend(range(arity * curr_idx + 1, arity * curr_idx + arity + 1))
+        return ahead + 1
     
     #Get all elements in the heap
     def get_elements(self):
@@ -435,32 +1600,23 @@ class BinaryMinHeap:
     def heapify_up(self, curr_idx):
         while curr_idx > 0:
             parent_idx = (curr_idx - 1) // 2
-            if self.heap[parent_idx][0]> self.heap[curr_idx][0] or (
-                    self.heap[parent_idx][0] == self.heap[curr_idx][0] and
-                    self.heap[parent_idx][2] > self.heap[curr_idx][2]):
+            if self.heap[parent_idx] > self.heap[curr_idx]:
                 self.swap(parent_idx, curr_idx)
                 curr_idx = parent_idx
             else:
                 break
 
     # Heapify down to maintain heap property
-    def heapify_down(self):
-        curr_idx = 0
+    def heapify_down(self, curr_idx=0):
         while True:
             lchild_idx = 2 * curr_idx + 1
             rchild_idx = 2 * curr_idx + 2
             smallestVal = curr_idx
 
-            if lchild_idx < len(self.heap) and (
-                    self.heap[lchild_idx][0] < self.heap[smallestVal][0] or (
-                    self.heap[lchild_idx][0] == self.heap[smallestVal][0] and
-                    self.heap[lchild_idx][2] < self.heap[smallestVal][2])):
+            if lchild_idx < len(self.heap) and self.heap[lchild_idx] < self.heap[smallestVal]:
                 smallestVal = lchild_idx
 
-            if rchild_idx < len(self.heap) and (
-                    self.heap[rchild_idx][0] < self.heap[smallestVal][0] or (
-                    self.heap[rchild_idx][0] == self.heap[smallestVal][0] and
-                    self.heap[rchild_idx][2] < self.heap[smallestVal][2])):
+            if rchild_idx < len(self.heap) and self.heap[rchild_idx] < self.heap[smallestVal]:
                 smallestVal = rchild_idx
 
             if smallestVal != curr_idx:
@@ -469,21 +1625,506 @@ class BinaryMinHeap:
             else:
                 break
     
-    # Swap elements 
+    # Swap elements and update their slots in the index
     def swap(self, i, j):
+        if instrumentation is not None:
+            instrumentation.heap_swaps += 1
         self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+        self.index[self.heap[i][2]] = i
+        self.index[self.heap[j][2]] = j
+
+
+# Indexed d-ary min heap: a shallower tree than the binary heap, with fewer swaps on insert and more
+# comparisons per level on removal
+class DaryHeap(BinaryMinHeap):
+    __slots__ = ()
+    arity = 4
+
+    def heapify_up(self, curr_idx):
+        heap = self.heap
+        while curr_idx > 0:
+            parent_idx = (curr_idx - 1) // self.arity
+            if heap[parent_idx] > heap[curr_idx]:
+                self.swap(parent_idx, curr_idx)
+                curr_idx = parent_idx
+            else:
+                break
+
+    def heapify_down(self, curr_idx=0):
+        heap = self.heap
+        while True:
+            first_child = self.arity * curr_idx + 1
+            if first_child >= len(heap):
+                break
+            children = range(first_child, min(first_child + self.arity, len(heap)))
+            smallest_child = min(children, key=heap.__getitem__)
+            if heap[smallest_child] < heap[curr_idx]:
+                self.swap(curr_idx, smallest_child)
+                curr_idx = smallest_child
+            else:
+                break
+
+
+# Waitlist on the heapq module. heapq cannot remove from the middle of the heap, so cancelled entries stay
+# in the list and are skipped when they reach the top; entries maps each waiting patron to their live entry.
+class HeapqWaitlist(Waitlist):
+    __slots__ = ("heap", "entries")
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []
+        self.entries = {} # patronId -> live entry
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, patronId):
+        return patronId in self.entries
+
+    def load(self, elements):
+        self.heap = list(elements)
+        heapq.heapify(self.heap)
+        self.entries = {element[2]: element for element in self.heap}
+        self.resume_sequence(self.heap)
+
+    def insert(self, element):
+        self.entries[element[2]] = element
+        heapq.heappush(self.heap, element)
+
+    def remove_min(self):
+        while self.heap:
+            element = heapq.heappop(self.heap)
+            if self.entries.get(element[2]) == element:
+                del self.entries[element[2]]
+                return element
+        return None
+
+    def remove_patron(self, patronId):
+        element = self.entries.pop(patronId, None)
+        if element is not None and len(self.heap) > 2 * len(self.entries) + 8:
+            # Mostly cancelled entries, rebuild from the live ones
+            self.heap = list(self.entries.values())
+            heapq.heapify(self.heap)
+        return element
+
+    def position(self, patronId):
+        target = self.entries.get(patronId)
+        if target is None:
+            return None
+        return sum(1 for element in self.entries.values() if element < target) + 1
+
+
+# Node of a PairingHeap. prev is the parent for the first child of a node and the left sibling otherwise.
+class PairingNode:
+    __slots__ = ("entry", "child", "sibling", "prev")
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.child = None
+        self.sibling = None
+        self.prev = None
+
+
+# Pairing heap waitlist: O(1) insert, O(log n) amortized removal of the minimum or of any patron
+class PairingHeap(Waitlist):
+    __slots__ = ("root", "index")
+
+    def __init__(self):
+        super().__init__()
+        self.root = None
+        self.index = {} # patronId -> PairingNode
+
+    def __iter__(self):
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            yield node.entry
+            child = node.child
+            while child is not None:
+                stack.append(child)
+                child = child.sibling
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, patronId):
+        return patronId in self.index
+
+    # Entries in priority order are inserted in O(1) each
+    def load(self, elements):
+        self.root = None
+        self.index = {}
+        for element in elements:
+            self.insert(element)
+        self.resume_sequence(elements)
+
+    # Link two heap roots, the larger becomes the first child of the smaller
+    @staticmethod
+    def meld(a, b):
+        if b.entry < a.entry:
+            a, b = b, a
+        b.sibling = a.child
+        if a.child is not None:
+            a.child.prev = b
+        a.child = b
+        b.prev = a
+        a.sibling = None
+        return a
+
+    # Two-pass pairing of a list of siblings into one heap
+    def merge_pairs(self, first):
+        pairs = []
+        node = first
+        while node is not None:
+            second = node.sibling
+            if second is None:
+                node.prev = None
+                pairs.append(node)
+                break
+            following = second.sibling
+            node.prev = second.prev = None
+            pairs.append(self.meld(node, second))
+            node = following
+        if not pairs:
+            return None
+        merged = pairs.pop()
+        while pairs:
+            merged = self.meld(pairs.pop(), merged)
+        return merged
+
+    def insert(self, element):
+        node = PairingNode(element)
+        self.index[element[2]] = node
+        self.root = node if self.root is None else self.meld(self.root, node)
+
+    def remove_min(self):
+        root = self.root
+        if root is None:
+            return None
+        del self.index[root.entry[2]]
+        self.root = self.merge_pairs(root.child)
+        return root.entry
+
+    def remove_patron(self, patronId):
+        node = self.index.get(patronId)
+        if node is None:
+            return None
+        if node is self.root:
+            return self.remove_min()
+        del self.index[patronId]
+        # Cut the node's subtree from the heap, then meld its children back in
+        if node.prev.child is node:
+            node.prev.child = node.sibling
+        else:
+            node.prev.sibling = node.sibling
+        if node.sibling is not None:
+            node.sibling.prev = node.prev
+        subtree = self.merge_pairs(node.child)
+        if subtree is not None:
+            self.root = self.meld(self.root, subtree)
+        return node.entry
+
+    #Only the entries ahead of the patron are visited, children are never ahead of their parent
+    def position(self, patronId):
+        node = self.index.get(patronId)
+        if node is None:
+            return None
+        target = node.entry
+        ahead = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.entry < target:
+                ahead += 1
+                child = node.child
+                while child is not None:
+                    stack.append(child)
+                    child = child.sibling
+        return ahead + 1
+
+
+# Waitlist backends selectable with --waitlist
+WAITLIST_BACKENDS = {
+    "binary": BinaryMinHeap,
+    "dary": DaryHeap,
+    "heapq": HeapqWaitlist,
+    "pairing": PairingHeap,
+}
+# Waitlist backend of a library unless another one is given. heapq was the fastest backend at every waitlist
+# length measured by benchmark.py waitlist, and waitlists are capped at 20 patrons.
+DEFAULT_WAITLIST = HeapqWaitlist
+
+
+# Class representing a patron and the books they hold or wait for
+class Patron:
+    __slots__ = ("patronId", "borrowed", "reserved")
+
+    def __init__(self, patronId):
+        self.patronId = patronId
+        self.borrowed = set() # bookIds currently borrowed by the patron
+        self.reserved = set() # bookIds the patron is on the waitlist of
+
+    # Drop a reservation, e.g. when the book is deleted
+    def cancel_reservation(self, bookId):
+        self.reserved.discard(bookId)
+
+    # Check if the patron neither holds nor waits for any book
+    def is_idle(self):
+        return not self.borrowed and not self.reserved
+
+
+# Loan period in clock ticks, used when BorrowBook gives no due date and when a book is allotted on return
+LOAN_PERIOD = 14
+
+# Class for the due-date index of the current loans
+# Loans are bucketed by due time, like the slots of a timing wheel, but only the times with loans have a
+# bucket and those times are kept sorted. Finding the loans due in a time window is a bisect followed by
+# the buckets in the window, so a sweep costs time proportional to the loans it returns, not to all loans.
+class LoanCalendar:
+    def __init__(self):
+        self.buckets = {} # due time -> {bookId: patronId}
+        self.times = [] # due times that have a bucket, sorted
+        self.due = {} # bookId -> due time
+
+    def __len__(self):
+        return len(self.due)
+
+    # Record the loan of a book
+    def add(self, bookId, patronId, due):
+        bucket = self.buckets.get(due)
+        if bucket is None:
+            bucket = self.buckets[due] = {}
+            insort(self.times, due)
+        bucket[bookId] = patronId
+        self.due[bookId] = due
+
+    # Drop the loan of a book, if any
+    def remove(self, bookId):
+        due = self.due.pop(bookId, None)
+        if due is None:
+            return
+        bucket = self.buckets[due]
+        del bucket[bookId]
+        if not bucket:
+            del self.buckets[due]
+            del self.times[bisect_left(self.times, due)]
+
+    # Loans with low <= due < high (no lower bound if low is None) as (due, bookId, patronId), in due order
+    def between(self, low, high):
+        times = self.times
+        loans = []
+        for idx in range(0 if low is None else bisect_left(times, low), bisect_left(times, high)):
+            due = times[idx]
+            loans.extend((due, bookId, patronId) for bookId, patronId in sorted(self.buckets[due].items()))
+        return loans
+
+
+# Default capacity of the hot-book cache, 0 disables it
+BOOK_CACHE_SIZE = 16384
+
+# Class for the bounded bookId -> tree node cache in front of the book map lookups, with CLOCK eviction
+# Entries sit in a ring of slots with a referenced bit set by every hit. To make room the hand sweeps the ring,
+# clearing referenced bits and evicting the first entry whose bit is already clear, so books hit since the hand
+# last passed survive. A hit costs a dictionary lookup and a bit store, with no reordering as in an LRU list.
+class BookCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = {} # bookId -> slot
+        self.keys = [] # bookId of each slot, None for a free slot
+        self.nodes = [] # tree node of each slot
+        self.referenced = bytearray(capacity) # referenced bit of each slot
+        self.hand = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    # Cached node of a book, None on a miss
+    def get(self, bookId):
+        slot = self.slots.get(bookId)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.referenced[slot] = 1
+        return self.nodes[slot]
+
+    # Cache the node of a book, evicting an entry if the cache is full
+    def put(self, bookId, node):
+        slot = self.slots.get(bookId)
+        if slot is not None:
+            self.nodes[slot] = node
+            return
+        if len(self.keys) < self.capacity:
+            slot = len(self.keys)
+            self.keys.append(bookId)
+            self.nodes.append(node)
+        else:
+            referenced = self.referenced
+            hand = self.hand
+            while referenced[hand]:
+                referenced[hand] = 0
+                hand = (hand + 1) % self.capacity
+            slot = hand
+            self.hand = (hand + 1) % self.capacity
+            if self.keys[slot] is not None:
+                del self.slots[self.keys[slot]]
+            self.keys[slot] = bookId
+            self.nodes[slot] = node
+        self.slots[bookId] = slot
+
+    # Drop the entry of a deleted book
+    def discard(self, bookId):
+        slot = self.slots.pop(bookId, None)
+        if slot is not None:
+            self.keys[slot] = None
+            self.nodes[slot] = None
+            self.referenced[slot] = 0
+
+    # Drop every entry, e.g. when the book map is rebuilt; the counters are kept
+    def clear(self):
+        self.slots = {}
+        self.keys = []
+        self.nodes = []
+        self.referenced = bytearray(self.capacity)
+        self.hand = 0
+
+
+# Length of the title n-grams in CatalogIndex
+TITLE_GRAM = 3
+
+# Class for the secondary indexes on author and title
+# Authors map to the set of their bookIds. Titles are indexed by their trigrams: a substring query intersects
+# the bookId sets of its trigrams, starting from the smallest, and checks the remaining candidates against
+# the title. Names and titles are matched case-insensitively and without their quotes.
+class CatalogIndex:
+    def __init__(self):
+        self.authors = {} # normalized author -> set of bookIds
+        self.titles = {} # bookId -> normalized title
+        self.grams = {} # title trigram -> set of bookIds
+
+    @staticmethod
+    def normalize(text):
+        return text.strip('"').casefold()
+
+    @staticmethod
+    def title_grams(title):
+        return {title[i:i + TITLE_GRAM] for i in range(len(title) - TITLE_GRAM + 1)}
+
+    def add(self, book):
+        self.authors.setdefault(self.normalize(book.authorName), set()).add(book.bookId)
+        title = self.titles[book.bookId] = self.normalize(book.bookName)
+        for gram in self.title_grams(title):
+            self.grams.setdefault(gram, set()).add(book.bookId)
+
+    def remove(self, book):
+        author = self.normalize(book.authorName)
+        bookIds = self.authors[author]
+        bookIds.discard(book.bookId)
+        if not bookIds:
+            del self.authors[author]
+        for gram in self.title_grams(self.titles.pop(book.bookId)):
+            bookIds = self.grams[gram]
+            bookIds.discard(book.bookId)
+            if not bookIds:
+                del self.grams[gram]
+
+    # Sorted bookIds of an author
+    def by_author(self, name):
+        return sorted(self.authors.get(self.normalize(name), ()))
+
+    # Sorted bookIds of the titles containing query
+    # Queries shorter than a trigram match most titles, they are answered by checking every title
+    def by_title(self, query):
+        query = self.normalize(query)
+        if len(query) < TITLE_GRAM:
+            return sorted(bookId for bookId, title in self.titles.items() if query in title)
+        postings = sorted((self.grams.get(gram, ()) for gram in self.title_grams(query)), key=len)
+        if not postings[0]:
+            return []
+        candidates = postings[0].intersection(*postings[1:])
+        titles = self.titles
+        return sorted(bookId for bookId in candidates if query in titles[bookId])
+
+
+# Binary snapshot layout (little endian)
+# Header: magic, format version, number of books, color flip count, then the library clock
+# Then one record per book in tree pre-order, so the exact tree shape and colors are restored:
+#   flags (red, has left child, has right child, has borrower), bookId, borrowing patron, due time of the loan,
+#   number of reservations, lengths of the title, author and availability strings, the three UTF-8 strings,
+#   then each reservation as (priority, sequence, patronId) in priority order
+# Version 1 snapshots stored reservations as (priority, patronId, timestamp) in heap order. Versions 1 and 2
+# have no clock or due times; they are still read, with every loan due one loan period after time 0.
+SNAPSHOT_MAGIC = b"GLIB"
+SNAPSHOT_VERSION = 3
+SNAPSHOT_HEADER = struct.Struct("<4sHQQ")
+SNAPSHOT_CLOCK = struct.Struct("<q")
+SNAPSHOT_BOOK = struct.Struct("<BqqqIIII")
+SNAPSHOT_BOOK_V2 = struct.Struct("<BqqIIII")
+SNAPSHOT_RESERVATION = struct.Struct("<qqq")
+SNAPSHOT_RESERVATION_V1 = struct.Struct("<qqd")
+SNAPSHOT_RED, SNAPSHOT_LEFT, SNAPSHOT_RIGHT, SNAPSHOT_BORROWED = 1, 2, 4, 8
+
+
+# Position of the bookId argument of the commands accepted by LibraryManagementSystem.execute_batch
+BATCH_BOOK_ARG = {"BorrowBook": 1, "ReturnBook": 1, "PrintBook": 0}
 
 
 # Class for the library management system
+# engine is the ordered map class of the books, waitlist the waitlist class of the book reservations and
+# cache_size the capacity of the hot-book cache (0 disables it)
 class LibraryManagementSystem:
-    def __init__(self):
-        self.bookTree = RedBlackTree() # Red black tree to store books
-        self.patrons = {} # Dictionary to store patrons 
+    def __init__(self, engine=DEFAULT_ENGINE, waitlist=DEFAULT_WAITLIST, cache_size=BOOK_CACHE_SIZE):
+        self.treeEngine = engine # Class of bookTree, also used by restore
+        self.waitlistBackend = waitlist # Class of the book waitlists, created when a first patron reserves
+        self.bookTree = engine() # Ordered map of the books, a red black tree by default
+        self.versioned = engine.versioned # Books are copied before changes, see writable_node
+        self.patrons = {} # Dictionary to store patrons with loans or reservations, by patronId
+        self.catalogIndex = None # Author and title index, built by the first search and then kept up to date
+        self.clock = 0 # Current time in ticks, moved forward by AdvanceClock
+        self.loans = LoanCalendar() # Due times of the current loans
+        self.bookCache = BookCache(cache_size) if cache_size else None # Hot books, None if disabled
+
+    # Get the patron entry for a patronId, creating it if needed
+    def get_patron(self, patronId):
+        patron = self.patrons.get(patronId)
+        if patron is None:
+            patron = self.patrons[patronId] = Patron(patronId)
+        return patron
+
+    # Drop the patron entry once it no longer holds or waits for any book
+    def release_patron(self, patron):
+        if patron.is_idle():
+            del self.patrons[patron.patronId]
 
     # Exit the program
     def quit(self):
         exit()
 
+    # Look up the tree node of a book through the hot-book cache, None if the book does not exist
+    def find_book(self, bookId):
+        cache = self.bookCache
+        if cache is None:
+            return self.bookTree.find(bookId)
+        node = cache.get(bookId)
+        if node is None:
+            node = self.bookTree.find(bookId)
+            if node is not None:
+                cache.put(bookId, node)
+        return node
+
+    # Node of a book about to be changed in place. A versioned engine copies the book, so that the versions taken
+    # before keep it as it was, and the cache is pointed at the copy
+    def writable_node(self, node):
+        node = self.bookTree.writable(node)
+        if self.bookCache is not None:
+            self.bookCache.put(node.val.bookId, node)
+        return node
+
     # Add a new book
     def add_book(self, bookId, bookName, authorName, isAvailable):
         newBook = BookNode(bookId, bookName, authorName, isAvailable)
@@ -491,44 +2132,22 @@ class LibraryManagementSystem:
 
     # Print details of a book
     def print_book(self, bookId):
-        node = self.bookTree.find(bookId)
+        return self.print_node(self.find_book(bookId), bookId)
+
+    # Print details of a book already looked up in the tree (node is None if it does not exist)
+    def print_node(self, node, bookId):
         if node is not None:
-            patron_ids = [patronId[1] for patronId in node.val.reservations.heap]
-            details = (
-                f"BookID = {node.val.bookId}\n"
-                f"Title = {node.val.bookName}\n"
-                f"Author = {node.val.authorName}\n"
-                f"Availability = {node.val.isAvailable}\n"
-                f"BorrowedBy = {node.val.borrowing_patron}\n"
-                f"Reservations = {patron_ids}"
-            )
-            return details
+            return node.val.render()
         else:
             return (f"Book {bookId} not found.")
 
-    # Print details of all books in the range id1 to id2
-    def print_books(self, node, book_id1, book_id2):
-        books_details = []  # List to store details of books
-        def process_book(book_node):
-            patron_ids = [patronId[1] for patronId in book_node.val.reservations.heap]
-            details = (
-                f"BookID = {book_node.val.bookId}\n"
-                f"Title = {book_node.val.bookName}\n"
-                f"Author = {book_node.val.authorName}\n"
-                f"Availability = {book_node.val.isAvailable}\n"
-                f"BorrowedBy = {book_node.val.borrowing_patron}\n"
-                f"Reservations = {patron_ids}"
-            )
-            books_details.append(details)
-        def inorder_traversal(node):
-            nonlocal books_details
-            if node is not None:
-                inorder_traversal(node.left)
-                if isinstance(node.val, BookNode) and book_id1 <= node.val.bookId <= book_id2:
-                    process_book(node)
-                inorder_traversal(node.right)
-        inorder_traversal(node)
-        return books_details
+    # Lazily yield details of the books in the range id1 to id2
+    # limit caps the number of books returned, after resumes the scan past the last bookId of a previous page
+    # A versioned engine is scanned through a version taken by this call, so the books can be read while
+    # the library keeps changing
+    def print_books(self, book_id1, book_id2, limit=None, after=None):
+        books = self.bookTree.version() if self.versioned else self.bookTree
+        return (book_node.val.render() for book_node in books.range_scan(book_id1, book_id2, limit, after))
 
     # Insert a new book
     def insert_book(self, bookId, bookName, authorName, isAvailable, borrowing_patron=None,
@@ -537,26 +2156,82 @@ class LibraryManagementSystem:
         newBook.isAvailable = isAvailable
         newBook.borrowing_patron = borrowing_patron
         if reservation_heap:
-            newBook.reservations.heap = reservation_heap
-        self.bookTree.insert(newBook) # Insert into tree
-
-    # Handle book borrowing
-    def borrow_book(self, patronId, bookId, patron_priority):
-        node = self.bookTree.find(bookId)
-
+            newBook.waitlist(self.waitlistBackend).load(reservation_heap)
+        node = self.bookTree.insert(newBook) # Insert into tree
+        if node is None:
+            return # Book already exists, the tree ignores it
+        if self.bookCache is not None:
+            self.bookCache.put(bookId, node)
+        if self.catalogIndex is not None:
+            self.catalogIndex.add(newBook)
+        if borrowing_patron is not None:
+            self.get_patron(borrowing_patron).borrowed.add(bookId)
+        for patronId in newBook.get_reservations():
+            self.get_patron(patronId).reserved.add(bookId)
+
+    # Load a catalog file with one book per line, given as the InsertBook arguments: bookId, "Title", "Author", "Yes"
+    # low and high optionally restrict the load to the books in that bookId range
+    def load_catalog(self, path, low=None, high=None):
+        try:
+            books = self.read_catalog(path, low, high)
+        except OSError as err:
+            return f"Catalog {path} not loaded: {err.strerror.lower()}."
+        except ValueError as err:
+            return f"Catalog {path} not loaded: {err}."
+        before = len(self.bookTree)
+        self.bookTree.bulk_load(books)
+        self.catalogIndex = None # rebuilt by the next search
+        if self.bookCache is not None:
+            self.bookCache.clear() # the map may have new nodes for the cached books
+        return f"Catalog {path} loaded: {len(self.bookTree) - before} books added"
+
+    # Read the books of a catalog file with ids in [low, high]; a malformed line raises ValueError naming its line number
+    @staticmethod
+    def read_catalog(path, low=None, high=None):
+        books = []
+        with open(path, "r") as catalog:
+            for line_number, line in enumerate(catalog, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    bookId, bookName, authorName, isAvailable = split_arguments(line)
+                    bookId = int(bookId)
+                except ValueError:
+                    raise ValueError(f"line {line_number}: expected bookId, \"name\", \"author\", \"availability\"") from None
+                if (low is not None and bookId < low) or (high is not None and bookId > high):
+                    continue
+                books.append(BookNode(bookId, bookName, authorName, isAvailable))
+        return books
+
+    # Handle book borrowing; the loan is due at due, or one loan period from now if no due time is given
+    def borrow_book(self, patronId, bookId, patron_priority, due=None):
+        return self.borrow_node(self.find_book(bookId), patronId, bookId, patron_priority, due)
+
+    # Handle borrowing of a book already looked up in the tree (node is None if it does not exist)
+    def borrow_node(self, node, patronId, bookId, patron_priority, due=None):
         if node is not None:
+            if self.versioned:
+                node = self.writable_node(node)
             if node.val.isAvailable == '"Yes"':
                 # If available, lend book
                 node.val.isAvailable = '"No"'
                 node.val.borrowing_patron = patronId
-                self.patrons
+                node.val.rendered = None
+                self.bookTree.availability_changed(node)
+                self.get_patron(patronId).borrowed.add(bookId)
+                self.loans.add(bookId, patronId, due if due is not None else self.clock + LOAN_PERIOD)
                 return f"Book {bookId} Borrowed by Patron {patronId}"
 
             else:
                 # If not available, add a reservation for that patron
-                reservation_added = node.val.add_reservation(patronId, patron_priority)
+                reservation_added = node.val.add_reservation(patronId, patron_priority, self.waitlistBackend)
+                if reservation_added is None:
+                    self.get_patron(patronId).reserved.add(bookId)
                 if reservation_added == "Waitlist full":
                     return f"Waitlist for Book {bookId} is full. Cannot add reservation for Patron {patronId}"
+                elif reservation_added == "Already reserved":
+                    return f"Book {bookId} is already reserved by Patron {patronId}"
                 else:
                     return f"Book {bookId} Reserved by Patron {patronId}"
 
@@ -565,34 +2240,111 @@ class LibraryManagementSystem:
 
     # Handle book return
     def return_book(self, patronId, bookId):
-        node = self.bookTree.find(bookId)
+        return self.return_node(self.find_book(bookId), patronId, bookId)
+
+    # Handle return of a book already looked up in the tree (node is None if it does not exist)
+    def return_node(self, node, patronId, bookId):
         opLine = ''
         if node is not None and node.val.isAvailable == '"No"' and node.val.borrowing_patron == patronId:
-            if len(node.val.reservations.heap) > 0: #If valid heap, handle reservations if any
-                reserved_patron_id = node.val.reservations.heap.pop(0)
-                node.val.borrowing_patron = reserved_patron_id[1]
+            if self.versioned:
+                node = self.writable_node(node)
+            patron = self.get_patron(patronId)
+            patron.borrowed.discard(bookId)
+            self.release_patron(patron)
+            self.loans.remove(bookId)
+            if node.val.has_reservations(): #If valid heap, handle reservations if any
+                reserved_patron_id = node.val.remove_reservation() # next patron in priority order
+                node.val.borrowing_patron = reserved_patron_id[2]
+                node.val.rendered = None
+                next_patron = self.get_patron(node.val.borrowing_patron)
+                next_patron.reserved.discard(bookId)
+                next_patron.borrowed.add(bookId)
+                self.loans.add(bookId, node.val.borrowing_patron, self.clock + LOAN_PERIOD)
                 opLine = f"Book {bookId} Returned by Patron {patronId}\n\n\n" \
                 f"Book {bookId} Allotted to Patron {node.val.borrowing_patron}"
             else:
                 node.val.isAvailable = '"Yes"'
                 node.val.borrowing_patron = None
+                node.val.rendered = None
+                self.bookTree.availability_changed(node)
                 opLine = f"Book {bookId} Returned by Patron {patronId}"
 
         else:
             opLine = f"Book {bookId} cannot be returned by Patron {patronId}."
         return opLine
 
+    # Run many BorrowBook, ReturnBook and PrintBook operations at once, given as (command, args) with int args.
+    # Operations are served in bookId order with finger search, each lookup starting from the previous book,
+    # and results are returned in the original order. These commands never change the tree shape and
+    # operations on different books are independent, so a stable sort keeps the per-book command order
+    # and the results match running the operations one by one.
+    def execute_batch(self, operations):
+        results = [None] * len(operations)
+        order = sorted(range(len(operations)), key=lambda idx: operations[idx][1][BATCH_BOOK_ARG[operations[idx][0]]])
+        finger = None
+        last_bookId = None
+        node = None
+        versioned = self.versioned
+        for idx in order:
+            comm, args = operations[idx]
+            bookId = args[BATCH_BOOK_ARG[comm]]
+            if bookId != last_bookId or versioned: # a versioned engine may have copied the node of the book
+                node = self.bookTree.find_from(finger, bookId)
+                last_bookId = bookId
+                if node is not None:
+                    finger = node
+            if comm == "BorrowBook":
+                results[idx] = self.borrow_node(node, args[0], bookId, args[2], args[3] if len(args) > 3 else None)
+            elif comm == "ReturnBook":
+                results[idx] = self.return_node(node, args[0], bookId)
+            else:
+                results[idx] = self.print_node(node, bookId)
+        return results
+
+    # Cancel the reservation of a patron for a book
+    def cancel_reservation(self, patronId, bookId):
+        node = self.find_book(bookId)
+        if node is None:
+            return f"Book {bookId} not found."
+        if self.versioned:
+            node = self.writable_node(node)
+        if node.val.cancel_reservation(patronId) is None:
+            return f"Patron {patronId} has no reservation for Book {bookId}."
+        patron = self.get_patron(patronId)
+        patron.cancel_reservation(bookId)
+        self.release_patron(patron)
+        return f"Reservation for Book {bookId} by Patron {patronId} cancelled"
+
+    # Position of a patron in the waitlist of a book
+    def waitlist_position(self, patronId, bookId):
+        node = self.find_book(bookId)
+        if node is None:
+            return f"Book {bookId} not found."
+        position = node.val.waitlist_position(patronId)
+        if position is None:
+            return f"Patron {patronId} has no reservation for Book {bookId}."
+        return f"Patron {patronId} is at position {position} in the waitlist for Book {bookId}"
+
     # Delete a book
     def delete_book(self, bookId):
-        node = self.bookTree.find(bookId)
+        node = self.find_book(bookId)
         if node is not None:
-            if node.val.reservations.heap:
+            if node.val.has_reservations():
                 reservations = node.val.get_reservations()
                 self.cancel_reservations(bookId, reservations)
                 opLine = f"Book {bookId} is no longer available. Reservations made by Patrons {', '.join(str(reservation) for reservation in reservations)} have been cancelled!"
             else:
                 opLine = f"Book {bookId} is no longer available."
-            self.bookTree.delete(bookId)
+            borrower = self.patrons.get(node.val.borrowing_patron)
+            if borrower is not None:
+                borrower.borrowed.discard(bookId)
+                self.release_patron(borrower)
+            self.loans.remove(bookId)
+            if self.catalogIndex is not None:
+                self.catalogIndex.remove(node.val)
+            if self.bookCache is not None:
+                self.bookCache.discard(bookId)
+            self.bookTree.delete_node(node)
         else:
             opLine = f"Book {bookId} not found."
         return opLine
@@ -607,8 +2359,8 @@ class LibraryManagementSystem:
         return node
     
     #Find the closest two books to a target book. 
-    def find_closest_book(self, node, target):
-        lowerBook, higherBook = self.findClosestBookHelper(node, target) # Find closest two books
+    def find_closest_book(self, target):
+        lowerBook, higherBook = self.findClosestBookHelper(target) # Find closest two books
         books_details = []
 
         if lowerBook is not None and higherBook is not None:
@@ -641,130 +2393,1424 @@ class LibraryManagementSystem:
         return books_details
     
     #Helper function for finding closest two books
-    def findClosestBookHelper(self, node, target, lowerBook=None, higherBook=None):
-        while node.val.bookId != 0:
-            if node.val.bookId == target:
-                return node, node   # if the node val equals the target, return the node itself as closest.
-            elif node.val.bookId < target:
-                lowerBook = node
-                node = node.right
-            else:
-                higherBook = node
-                node = node.left
-        return lowerBook, higherBook  #return closest lower and higher nodes
+    def findClosestBookHelper(self, target):
+        lowerBook = self.bookTree.floor(target)
+        if lowerBook is not None and lowerBook.val.bookId == target:
+            return lowerBook, lowerBook   # if the book equals the target, return the book itself as closest.
+        return lowerBook, self.bookTree.ceiling(target)  #return closest lower and higher books
 
     # Get book details 
     def get_book_details(self, node):
-        patron_ids = [patronId[1] for patronId in node.val.reservations.heap]
-        return (
-            f"BookID = {node.val.bookId}\n"
-            f"Title = {node.val.bookName}\n"
-            f"Author = {node.val.authorName}\n"
-            f"Availability = {node.val.isAvailable}\n"
-            f"BorrowedBy = {node.val.borrowing_patron}\n"
-            f"Reservations = {patron_ids}"
-        )
+        return node.val.render()
     
+    # Details of the k books closest to target, in bookId order
+    def find_closest_books(self, target, k):
+        return [node.val.render() for node in self.bookTree.closest(target, k)]
+
     # Cancel reservations
     def cancel_reservations(self, bookId, patrons):
         for patronId in patrons: # Cancel reservations of given patrons
             patron = self.patrons.get(patronId, None)
             if patron is not None:
                 patron.cancel_reservation(bookId)
+                self.release_patron(patron)
+
+    # Books borrowed and reserved by a patron, served from the patron index
+    def patron_status(self, patronId):
+        patron = self.patrons.get(patronId)
+        borrowed = sorted(patron.borrowed) if patron is not None else []
+        reserved = sorted(patron.reserved) if patron is not None else []
+        return self.format_patron_status(patronId, borrowed, reserved)
+
+    @staticmethod
+    def format_patron_status(patronId, borrowed, reserved):
+        return (
+            f"PatronID = {patronId}\n"
+            f"Borrowed = {borrowed}\n"
+            f"Reserved = {reserved}"
+        )
+
+    # Loans due before now as (due, bookId, patronId), by due time and then bookId
+    def overdue_loans(self, now):
+        return self.loans.between(None, now)
+
+    # Move the clock forward to t and return the loans that became overdue, None if t is before the clock
+    def advance_clock(self, t):
+        if t < self.clock:
+            return None
+        loans = self.loans.between(self.clock, t)
+        self.clock = t
+        return loans
+
+    # Hit and miss counters of the hot-book cache
+    def cache_stats(self):
+        cache = self.bookCache
+        if cache is None:
+            return "Book cache is disabled."
+        return self.format_cache_stats(cache.hits, cache.misses, len(cache), cache.capacity)
+
+    @staticmethod
+    def format_cache_stats(hits, misses, size, capacity):
+        lookups = hits + misses
+        hit_rate = f"{100 * hits / lookups:.1f}%" if lookups else "n/a"
+        return f"Book Cache: {hits} hits, {misses} misses, hit rate {hit_rate}, {size} of {capacity} books cached"
+
+    # Number of books with bookId in the range id1 to id2
+    def count_books(self, book_id1, book_id2):
+        return f"Book Count: {self.bookTree.count_range(book_id1, book_id2)[0]}"
+
+    # Number of available books with bookId in the range id1 to id2
+    def count_available(self, book_id1, book_id2):
+        return f"Available Book Count: {self.bookTree.count_range(book_id1, book_id2)[1]}"
+
+    # Position of a book in bookId order
+    def book_rank(self, bookId):
+        rank = self.bookTree.rank(bookId)
+        if rank is None:
+            return f"Book {bookId} not found."
+        return f"Book {bookId} has rank {rank}"
+
+    # Details of the book with the k-th smallest bookId
+    def kth_book(self, k):
+        node = self.bookTree.select(k)
+        if node is None:
+            return f"No book at rank {k}."
+        return self.get_book_details(node)
+
+    # Write the catalog, loans, waitlists and color flip count to a binary snapshot file
+    # The snapshot is written to a temporary file and atomically renamed over path once durable, so a crash
+    # leaves either the previous snapshot or the new one
+    # A file that cannot be written gives an error line and leaves no temporary file behind
+    def snapshot(self, path):
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "wb") as snapshot_file:
+                self.write_snapshot(snapshot_file)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            replace_durably(temp_path, path)
+        except OSError as err:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return f"Snapshot {path} not saved: {err.strerror.lower()}."
+        return f"Snapshot saved to {path}: {len(self.bookTree)} books"
+
+    # Write the snapshot records of the library to a binary file
+    def write_snapshot(self, snapshot_file):
+        tree = self.bookTree
+        snapshot_file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(tree),
+                                                 tree.color_flip_count or 0))
+        snapshot_file.write(SNAPSHOT_CLOCK.pack(self.clock))
+        for node, flags in tree.preorder():
+            book = node.val
+            title, author, availability = (book.bookName.encode(), book.authorName.encode(),
+                                           book.isAvailable.encode())
+            reservations = book._reservations.ordered() if book._reservations is not None else []
+            flags |= SNAPSHOT_BORROWED if book.borrowing_patron is not None else 0
+            borrower = book.borrowing_patron if book.borrowing_patron is not None else 0
+            due = self.loans.due.get(book.bookId, 0)
+            snapshot_file.write(SNAPSHOT_BOOK.pack(flags, book.bookId, borrower, due, len(reservations),
+                                                   len(title), len(author), len(availability)))
+            snapshot_file.write(title)
+            snapshot_file.write(author)
+            snapshot_file.write(availability)
+            for reservation in reservations:
+                snapshot_file.write(SNAPSHOT_RESERVATION.pack(*reservation))
+
+    # Replace the library state with a snapshot file, rebuilding the tree in linear time from the memory-mapped file.
+    # A truncated or corrupt file raises ValueError and leaves the library as it was
+    def restore(self, path):
+        with open(path, "rb") as snapshot_file:
+            if os.fstat(snapshot_file.fileno()).st_size < SNAPSHOT_HEADER.size:
+                raise ValueError(f"{path} is not a GatorLibrary snapshot")
+            with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                magic, version, books, color_flip_count = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+                if magic != SNAPSHOT_MAGIC or version not in (1, 2, SNAPSHOT_VERSION):
+                    raise ValueError(f"{path} is not a GatorLibrary snapshot")
+                previous = self.bookTree, self.patrons, self.catalogIndex, self.clock, self.loans
+                self.bookTree = self.treeEngine()
+                self.patrons = {}
+                self.catalogIndex = None
+                self.clock = 0
+                self.loans = LoanCalendar()
+                try:
+                    self.read_snapshot(buffer, version, books, color_flip_count)
+                except (struct.error, UnicodeDecodeError, ValueError, StopIteration) as err:
+                    self.bookTree, self.patrons, self.catalogIndex, self.clock, self.loans = previous
+                    raise ValueError(f"{path} is a truncated or corrupt snapshot") from err
+        if self.bookCache is not None:
+            self.bookCache.clear()
+
+    # Rebuild the tree, patrons and loans from the records of a snapshot after its header
+    def read_snapshot(self, buffer, version, books, color_flip_count):
+        tree = self.bookTree
+        reservation_record = SNAPSHOT_RESERVATION_V1 if version == 1 else SNAPSHOT_RESERVATION
+        offset = SNAPSHOT_HEADER.size
+        if version == SNAPSHOT_VERSION:
+            self.clock, = SNAPSHOT_CLOCK.unpack_from(buffer, offset)
+            offset += SNAPSHOT_CLOCK.size
+
+        # Yield the (flags, book) records in file order; the engine rebuilds the tree from them
+        def read_records():
+            nonlocal offset
+            for _ in range(books):
+                if version == SNAPSHOT_VERSION:
+                    (flags, bookId, borrower, due, reservation_count,
+                     title_len, author_len, availability_len) = SNAPSHOT_BOOK.unpack_from(buffer, offset)
+                    offset += SNAPSHOT_BOOK.size
+                else:
+                    (flags, bookId, borrower, reservation_count,
+                     title_len, author_len, availability_len) = SNAPSHOT_BOOK_V2.unpack_from(buffer, offset)
+                    offset += SNAPSHOT_BOOK_V2.size
+                    due = LOAN_PERIOD
+                if offset + title_len + author_len + availability_len > len(buffer):
+                    raise ValueError("book record runs past the end of the snapshot")
+                title = buffer[offset:offset + title_len].decode()
+                offset += title_len
+                author = buffer[offset:offset + author_len].decode()
+                offset += author_len
+                availability = buffer[offset:offset + availability_len].decode()
+                offset += availability_len
+                book = BookNode(bookId, title, author, availability)
+                if flags & SNAPSHOT_BORROWED:
+                    book.borrowing_patron = borrower
+                    self.get_patron(borrower).borrowed.add(bookId)
+                    self.loans.add(bookId, borrower, due)
+                if reservation_count:
+                    reservations = []
+                    for _ in range(reservation_count):
+                        reservation = reservation_record.unpack_from(buffer, offset)
+                        offset += reservation_record.size
+                        reservations.append(reservation)
+                    if version == 1:
+                        # Order by priority and timestamp, then number the reservations in that order
+                        reservations.sort(key=lambda reservation: (reservation[0], reservation[2]))
+                        reservations = [(priority, sequence, patronId)
+                                        for sequence, (priority, patronId, _) in enumerate(reservations)]
+                    for reservation in reservations:
+                        self.get_patron(reservation[2]).reserved.add(bookId)
+                    book.waitlist(self.waitlistBackend).load(reservations)
+
+                yield flags, book
+
+        tree.load_preorder(read_records())
+        if tree.color_flip_count is not None:
+            tree.color_flip_count = color_flip_count
+
+    # Author and title index, built from the whole catalog on first use
+    def search_index(self):
+        if self.catalogIndex is None:
+            self.catalogIndex = CatalogIndex()
+            for node in self.bookTree.range_scan(float("-inf"), float("inf")):
+                self.catalogIndex.add(node.val)
+        return self.catalogIndex
+
+    # Details of the books of an author, in bookId order
+    def search_by_author(self, name):
+        return [self.get_book_details(self.find_book(bookId)) for bookId in self.search_index().by_author(name)]
+
+    # Details of the books whose title contains query, in bookId order
+    def search_title(self, query):
+        return [self.get_book_details(self.find_book(bookId)) for bookId in self.search_index().by_title(query)]
 
     # Return the color flip count that is calculated during program execution
     def color_flip_count(self):
         return self.bookTree.color_flip_count
 
 
-def main(input_file_name):
-    #Create a LibraryManagementSstem object
-    library = LibraryManagementSystem()
-    # Read input from the passed file (input.txt)
-    with open(input_file_name, "r") as file:
-        lines = file.readlines()
-        output_lines = []
-
-        # Parse Command String
-        def parseCommand(command_string):
-            parts = command_string.split('(')
-            comm = parts[0].strip()
-            if len(parts) > 1:
-                inputArgs = parts[1].rstrip(')').split(',')
-                inputArgs = [arg.strip() for arg in inputArgs]
-                return comm, inputArgs #Return command along with the argument list
-            else:
-                return comm, []
+# Size of the buffer used when writing results
+OUTPUT_BUFFER_SIZE = 1 << 20
 
-        
-        for l in lines:
-            l = l.strip() #Removing whitespace
-            output_line = None
+# Open the output stream; results for stdin input go to stdout, otherwise to <input>_output_file.txt
+def open_output(input_file_name):
+    if input_file_name == "-":
+        return nullcontext(sys.stdout)
+    # Create output file based on the input filename
+    output_filename = splitext(input_file_name)[0] + "_output_file.txt"
+    return open(output_filename, 'w', buffering=OUTPUT_BUFFER_SIZE)
 
-            if l == "Quit()": #check for quit and handle 
-                output_line = f"Program Terminated!!"
-                output_lines.append(output_line)
-                break
 
-            else: #parse the command string
-                comm, *args = parseCommand(l)
-                print(comm)
-                args = args[0]
-                #Handle each case of command as specified in the description. Call the respective method
-                if comm == "InsertBook":
-                    bookId, title, author, isAvailable = args[0],args[1],args[2],args[3]
-                    library.insert_book(int(bookId), title, author, isAvailable, None, None)
-                elif comm == "PrintBook":
-                    bookId = args[0]
-                    output_line = library.print_book(bookId)
-                elif comm == "PrintBooks":
-                    book_id1, book_id2 = args[0], args[1]
-                    books = library.print_books(library.bookTree.root, int(book_id1), int(book_id2))
-                    all_books = [
-                        f"{book}\n" for book in books]
-                    # Join lines and print 
-                    output_line = '\n'.join(all_books)
-                elif comm == "FindClosestBook":
-                    target = args[0]
-                    closest_books = library.find_closest_book(library.bookTree.root, int(target))
-                    all_closest_books = [
-                        f"{book}\n" for book in closest_books]
-                    # Join lines and print 
-                    output_line = '\n'.join(all_closest_books)
-                elif comm == "BorrowBook":
-                    patronId, bookId, priority = args[0], args[1], args[2]
-                    output_line = library.borrow_book(int(patronId), int(bookId), int(priority))
-                elif comm == "ReturnBook":
-                    patronId, bookId = args
-                    output_line = library.return_book(int(patronId), int(bookId))
-                elif comm == "DeleteBook":
-                    bookId = args[0]
-                    output_line = library.delete_book(int(bookId))
-                elif comm == "ColorFlipCount":
-                    output_line = f"Colour Flip Count: {library.bookTree.color_flip_count}"
+# Log-scale latency histogram: BUCKETS_PER_OCTAVE buckets per doubling of the latency in nanoseconds
+BUCKETS_PER_OCTAVE = 4
 
-            if output_line is not None:
-                #Append to output file
-                output_lines.append(output_line)
-                output_lines.append("\n")
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = {} # bucket index -> number of samples
+        self.count = 0
+        self.total = 0.0 # seconds
+
+    def add(self, seconds):
+        nanoseconds = seconds * 1e9
+        bucket = int(math.log2(nanoseconds) * BUCKETS_PER_OCTAVE) if nanoseconds > 1 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+
+    # Latency in seconds below which a fraction q of the samples fall (upper bound of the bucket)
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1e9
+        return 0.0
+
+
+# Quantiles reported for each command
+STATS_QUANTILES = (0.5, 0.95, 0.99)
+
+# Class collecting opt-in statistics: per-command latency histograms, rotations and heap swaps (binary and d-ary
+# waitlists only, reported as None for the other backends)
+# Instrumentation is enabled by setting the module-level instrumentation object; when it is None the
+# only cost is one global check in rotateLeft/rotateRight and BinaryMinHeap.swap
+class Instrumentation:
+    def __init__(self, path):
+        self.path = path # .json for JSON, anything else for Prometheus text
+        self.rotations = 0
+        self.heap_swaps = 0
+        self.latencies = {} # command -> LatencyHistogram
+
+    # Record the latency of one command
+    def record(self, comm, seconds):
+        histogram = self.latencies.get(comm)
+        if histogram is None:
+            histogram = self.latencies[comm] = LatencyHistogram()
+        histogram.add(seconds)
+
+    # Statistics as a dictionary
+    def report(self, library):
+        return {
+            "commands": {
+                comm: {
+                    "count": histogram.count,
+                    "total_seconds": histogram.total,
+                    **{f"p{int(q * 100)}_seconds": histogram.quantile(q) for q in STATS_QUANTILES},
+                }
+                for comm, histogram in sorted(self.latencies.items())
+            },
+            "rotations": self.rotations,
+            "heap_swaps": self.heap_swaps if library.waitlistBackend.counts_swaps else None,
+            "color_flips": library.bookTree.color_flip_count,
+            "books": len(library.bookTree),
+            "tree_height": library.bookTree.height(),
+            "book_cache_hits": library.bookCache.hits if library.bookCache is not None else None,
+            "book_cache_misses": library.bookCache.misses if library.bookCache is not None else None,
+        }
+
+    # Statistics in the Prometheus text exposition format
+    def prometheus(self, library):
+        report = self.report(library)
+        lines = ["# TYPE gatorlibrary_command_latency_seconds summary"]
+        for comm, stats in report["commands"].items():
+            for q in STATS_QUANTILES:
+                lines.append(f'gatorlibrary_command_latency_seconds{{command="{comm}",quantile="{q}"}} '
+                             f'{stats[f"p{int(q * 100)}_seconds"]}')
+            lines.append(f'gatorlibrary_command_latency_seconds_sum{{command="{comm}"}} {stats["total_seconds"]}')
+            lines.append(f'gatorlibrary_command_latency_seconds_count{{command="{comm}"}} {stats["count"]}')
+        for name, kind in (("rotations", "counter"), ("heap_swaps", "counter"), ("color_flips", "counter"),
+                           ("books", "gauge"), ("tree_height", "gauge"), ("book_cache_hits", "counter"),
+                           ("book_cache_misses", "counter")):
+            if report[name] is None:
+                continue # not tracked by the book map engine or the waitlist backend
+            metric = f"gatorlibrary_{name}_total" if kind == "counter" else f"gatorlibrary_{name}"
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {report[name]}")
+        return "\n".join(lines) + "\n"
+
+    # Write the statistics file
+    def write(self, library):
+        with open(self.path, "w") as stats_file:
+            if self.path.endswith(".json"):
+                json.dump(self.report(library), stats_file, indent=2)
+            else:
+                stats_file.write(self.prometheus(library))
+
+
+# Active Instrumentation, None when statistics are disabled
+instrumentation = None
+
+
+# Error raised for command lines that cannot be parsed
+class CommandError(ValueError):
+    pass
+
+
+# Split a comma separated argument list in one pass; double-quoted arguments may contain commas and keep their quotes
+def split_arguments(body):
+    pieces = body.split(',')
+    if '"' in body:
+        segments = body.split('"') # quoted contents are at the odd positions
+        if not len(segments) % 2:
+            raise CommandError(f"unterminated quoted argument in {body!r}")
+        quoted_comma = ',' in ''.join(segments[1::2])
+    else:
+        quoted_comma = False
+    if not quoted_comma:
+        # Every piece is one argument
+        inputArgs = [piece.strip() for piece in pieces]
+        return inputArgs if inputArgs != [''] else []
+    inputArgs = []
+    pending = None # quoted argument split by a comma inside the quotes
+    for piece in pieces:
+        if pending is not None:
+            pending += ',' + piece
+            if piece.count('"') % 2:
+                inputArgs.append(pending.strip())
+                pending = None
+        elif piece.count('"') % 2:
+            pending = piece
+        else:
+            inputArgs.append(piece.strip())
+    if pending is not None:
+        raise CommandError(f"unterminated quoted argument {pending.strip()!r}")
+    return inputArgs
+
+
+# Strip the quotes of a file path argument
+def path_argument(arg):
+    return arg.strip('"')
+
+
+# Output of a list of book details, each followed by a blank line
+def format_books(books):
+    output = '\n\n'.join(books)
+    return output + '\n' if output else output
+
+# Handlers for commands whose result needs formatting
+def print_books_command(library, book_id1, book_id2, limit=None, after=None):
+    return format_books(library.print_books(book_id1, book_id2, limit, after))
+
+def find_closest_book_command(library, target):
+    return format_books(library.find_closest_book(target))
+
+def find_closest_books_command(library, target, k):
+    return format_books(library.find_closest_books(target, k))
+
+def search_by_author_command(library, name):
+    return format_books(library.search_by_author(name)) or f"No books found for Author {name}."
+
+def search_title_command(library, query):
+    return format_books(library.search_title(query)) or f"No books found for Title {query}."
+
+# Output of a list of (due, bookId, patronId) loans, one per line
+def format_loans(loans):
+    return '\n'.join(f"Book {bookId} Borrowed by Patron {patronId} was due at {due}" for due, bookId, patronId in loans)
+
+def overdue_command(library, now):
+    return format_loans(library.overdue_loans(now)) or "No overdue loans."
+
+def format_clock_advance(t, loans):
+    if loans is None:
+        return f"Clock cannot move back to {t}."
+    output = f"Clock advanced to {t}"
+    return output + '\n' + format_loans(loans) if loans else output
+
+def advance_clock_command(library, t):
+    return format_clock_advance(t, library.advance_clock(t))
+
+def color_flip_count_command(library):
+    if library.bookTree.color_flip_count is None:
+        return "Colour Flip Count: not tracked by this engine"
+    return f"Colour Flip Count: {library.bookTree.color_flip_count}"
+
+def stats_command(library):
+    if instrumentation is None:
+        return "Stats collection is not enabled."
+    instrumentation.write(library)
+    return f"Stats saved to {instrumentation.path}"
+
+
+# Dispatch table: command name -> (handler, argument types, number of required arguments)
+# Handlers are called as handler(library, *converted_arguments) and return the output line or None
+COMMANDS = {
+    "InsertBook": (LibraryManagementSystem.insert_book, (int, str, str, str), 4),
+    "PrintBook": (LibraryManagementSystem.print_book, (int,), 1),
+    # Optional third and fourth arguments page the range: PrintBooks(id1, id2, limit, afterId)
+    "PrintBooks": (print_books_command, (int, int, int, int), 2),
+    "FindClosestBook": (find_closest_book_command, (int,), 1),
+    "FindClosestBooks": (find_closest_books_command, (int, int), 2),
+    # Optional fourth argument: due time of the loan, by default one loan period from the current clock
+    "BorrowBook": (LibraryManagementSystem.borrow_book, (int, int, int, int), 3),
+    "ReturnBook": (LibraryManagementSystem.return_book, (int, int), 2),
+    "DeleteBook": (LibraryManagementSystem.delete_book, (int,), 1),
+    "Snapshot": (LibraryManagementSystem.snapshot, (path_argument,), 1),
+    "PatronStatus": (LibraryManagementSystem.patron_status, (int,), 1),
+    "CancelReservation": (LibraryManagementSystem.cancel_reservation, (int, int), 2),
+    "WaitlistPosition": (LibraryManagementSystem.waitlist_position, (int, int), 2),
+    "LoadCatalog": (LibraryManagementSystem.load_catalog, (path_argument,), 1),
+    "CountBooks": (LibraryManagementSystem.count_books, (int, int), 2),
+    "CountAvailable": (LibraryManagementSystem.count_available, (int, int), 2),
+    "BookRank": (LibraryManagementSystem.book_rank, (int,), 1),
+    "KthBook": (LibraryManagementSystem.kth_book, (int,), 1),
+    "SearchByAuthor": (search_by_author_command, (str,), 1),
+    "SearchTitle": (search_title_command, (str,), 1),
+    "Overdue": (overdue_command, (int,), 1),
+    "AdvanceClock": (advance_clock_command, (int,), 1),
+    "CacheStats": (LibraryManagementSystem.cache_stats, (), 0),
+    "ColorFlipCount": (color_flip_count_command, (), 0),
+    "Stats": (stats_command, (), 0),
+}
+
+
+# Build the function converting the argument string of a command to the declared argument types
+def make_argument_parser(arg_types):
+    converted = [(idx, arg_type) for idx, arg_type in enumerate(arg_types) if arg_type is not str]
+
+    def parse_arguments(body):
+        args = split_arguments(body)
+        for idx, arg_type in converted:
+            if idx < len(args):
+                args[idx] = arg_type(args[idx])
+        return args
+    return parse_arguments
+
+# Command name -> (integer arguments only, argument parser, number of required arguments, maximum number of arguments)
+# int() ignores surrounding spaces, so integer-only argument lists are converted without tokenizing or stripping
+ARGUMENT_PARSERS = {comm: (bool(arg_types) and all(arg_type is int for arg_type in arg_types),
+                           make_argument_parser(arg_types), required, len(arg_types))
+                    for comm, (_, arg_types, required) in COMMANDS.items()}
+
+# Fast path of parse_line for integer-only commands: command name -> accepted numbers of arguments.
+# Commands taking exactly one share ONE_ARGUMENT and are converted by a single int(), without splitting.
+ONE_ARGUMENT = range(1, 2)
+INTEGER_ARGUMENTS = {comm: ONE_ARGUMENT if required == maximum == 1 else range(required, maximum + 1)
+                     for comm, (integer_only, _, required, maximum) in ARGUMENT_PARSERS.items() if integer_only}
+
+
+# Parse a command line and convert its arguments to the declared types
+# Well-formed integer-only commands and InsertBook lines without quoted commas, most of a command log, are
+# converted by the fast paths without the table lookups of parse_command_line, which handles everything else and
+# produces the error messages
+def parse_line(command_string):
+    comm, _, body = command_string.partition('(')
+    if body[-1:] == ')':
+        counts = INTEGER_ARGUMENTS.get(comm)
+        if counts is not None:
+            try:
+                args = [int(body[:-1])] if counts is ONE_ARGUMENT else [*map(int, body[:-1].split(','))]
+            except ValueError:
+                pass
+            else:
+                if len(args) in counts:
+                    return comm, args
+        elif comm == "InsertBook":
+            # When every piece holds an even number of quotes no comma is quoted, so the pieces are the arguments
+            try:
+                bookId, bookName, authorName, isAvailable = body[:-1].split(',')
+                bookId = int(bookId)
+            except ValueError:
+                pass
+            else:
+                if not (bookName.count('"') | authorName.count('"') | isAvailable.count('"')) & 1:
+                    return comm, [bookId, bookName.strip(), authorName.strip(), isAvailable.strip()]
+    return parse_command_line(command_string)
+
+
+# Checked parse of a command line, see parse_line
+def parse_command_line(command_string):
+    open_idx = command_string.find('(')
+    comm = command_string[:open_idx]
+    parser = ARGUMENT_PARSERS.get(comm)
+    if parser is None or command_string[-1:] != ')':
+        # Surrounding spaces, a malformed line or an unknown command
+        command_string = command_string.strip()
+        open_idx = command_string.find('(')
+        if open_idx <= 0 or command_string[-1:] != ')':
+            raise CommandError(f"malformed command {command_string!r}, expected Name(arguments)")
+        comm = command_string[:open_idx].strip()
+        if comm not in ARGUMENT_PARSERS:
+            raise CommandError(f"unknown command {comm!r}")
+        return parse_command_line(comm + command_string[open_idx:])
+    integer_only, parse_arguments, required, maximum = parser
+    try:
+        if integer_only:
+            args = list(map(int, command_string[open_idx + 1:-1].split(',')))
+        else:
+            args = parse_arguments(command_string[open_idx + 1:-1])
+    except CommandError:
+        raise
+    except ValueError:
+        raise CommandError(f"invalid argument in {command_string!r}") from None
+    if not required <= len(args) <= maximum:
+        expected = required if required == maximum else f"{required} to {maximum}"
+        raise CommandError(f"{comm} takes {expected} arguments, got {len(args)}")
+    return comm, args
+
+
+#Handle each case of command as specified in the description. Call the respective method and return the output line
+def execute_command(library, comm, args):
+    return COMMANDS[comm][0](library, *args)
+
+
+# Yield (line number, line, command, arguments) for the commands of a text stream, Quit() as the command "Quit".
+# Lines that cannot be parsed are reported on stderr and skipped.
+def read_commands(file):
+    for line_number, l in enumerate(file, 1):
+        l = l.strip() #Removing whitespace
+        if l == "Quit()":
+            yield line_number, l, "Quit", []
+            continue
+        if not l:
+            continue # blank line
+        try:
+            comm, args = parse_line(l)
+        except CommandError as err:
+            print(f"Error: line {line_number}: {err}", file=sys.stderr)
+            continue
+        yield line_number, l, comm, args
+
+
+# Byte-string command name -> (command, integer arguments only, argument parser, required and maximum arguments)
+MAPPED_PARSERS = {comm.encode(): (comm, *parser) for comm, parser in ARGUMENT_PARSERS.items()}
+# One line of a mapped command file: Name(arguments) ending the line (the common case), or any other line
+MAPPED_LINE = re.compile(rb"(?:([A-Za-z]+)\(([^\n]*)\)\r?|([^\n]*))\n")
+# Bytes of a mapped command file scanned at a time
+MAPPED_CHUNK_SIZE = 1 << 20
+
+# Like read_commands, for a command file opened in binary mode. The file is memory-mapped and split into lines and
+# tokenized by a regular expression scan over the mapping, a chunk at a time, so the file is never decoded as a
+# whole. Integer arguments are converted from the bytes, and text is decoded only for the arguments of commands
+# taking strings and for the lines of the commands in keep_lines (line is None for the others). Lines the fast
+# path does not accept go through parse_line, which also produces the error messages.
+def mapped_commands(file, keep_lines=()):
+    if os.fstat(file.fileno()).st_size == 0:
+        return # empty files cannot be mapped
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        get_parser = MAPPED_PARSERS.get
+        complete = buffer.rfind(b"\n") + 1 # end of the last line with a line break
+        line_number = 0
+        pos = 0
+        while pos < complete:
+            end = buffer.find(b"\n", min(pos + MAPPED_CHUNK_SIZE, complete) - 1) + 1
+            for name, body, other in MAPPED_LINE.findall(buffer, pos, end):
+                line_number += 1
+                parser = get_parser(name)
+                if parser is not None:
+                    comm, integer_only, parse_arguments, required, maximum = parser
+                    try:
+                        args = list(map(int, body.split(b","))) if integer_only else parse_arguments(body.decode())
+                    except (ValueError, CommandError):
+                        args = None
+                    if args is not None and required <= len(args) <= maximum:
+                        yield line_number, (name + b"(" + body + b")").decode() if comm in keep_lines else None, comm, args
+                        continue
+                # Quit(), a blank line, unusual spacing or an invalid line
+                yield from parse_mapped_line(line_number, name + b"(" + body + b")" if name else other)
+            pos = end
+        if complete < len(buffer):
+            yield from parse_mapped_line(line_number + 1, buffer[complete:]) # last line without a line break
+
+# Slow path of mapped_commands for one line
+def parse_mapped_line(line_number, raw_line):
+    l = raw_line.decode().strip()
+    if l == "Quit()":
+        yield line_number, l, "Quit", []
+    elif l:
+        try:
+            comm, args = parse_line(l)
+        except CommandError as err:
+            print(f"Error: line {line_number}: {err}", file=sys.stderr)
+            return
+        yield line_number, l, comm, args
+
+
+# Rename temp_path over path and make the rename durable by syncing the directory
+def replace_durably(temp_path, path):
+    os.replace(temp_path, path)
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+# Commands that change the library state and are written to the journal
+JOURNALED_COMMANDS = {"InsertBook", "BorrowBook", "ReturnBook", "DeleteBook", "CancelReservation", "LoadCatalog",
+                      "AdvanceClock"}
+# Default number of journal records per fsync
+JOURNAL_GROUP_SIZE = 64
+# Prefix of the journal header line naming the snapshot the journal continues from
+JOURNAL_HEADER = "# snapshot "
+
+# Class for the append-only write-ahead journal of mutating commands
+# Records are command lines. They are written before the command runs and made durable with one fsync per
+# group of group_size records (group commit), so a crash loses at most the last uncommitted group.
+# The record of a command that fails is rolled back, so the journal only holds commands that succeeded.
+# A journal that continues from a snapshot starts with the header line "# snapshot <absolute path>".
+class Journal:
+    def __init__(self, path, group_size=JOURNAL_GROUP_SIZE, snapshot_path=None):
+        self.path = path
+        self.group_size = group_size
+        self.pending = 0 # records written since the last fsync
+        if snapshot_path is not None and (not os.path.exists(path) or not os.path.getsize(path)):
+            self.start(snapshot_path) # a new journal on top of a restored snapshot
+        self.open()
+
+    # Open the journal for appending after its existing records
+    def open(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = self.file.seek(0, os.SEEK_END) # bytes in the journal, tracked to roll back without flushing
+        self.last = self.size # offset of the last record
+
+    # Atomically replace the journal by an empty one whose header names the snapshot it continues from
+    def start(self, snapshot_path):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as journal_file:
+            journal_file.write(f"{JOURNAL_HEADER}{os.path.abspath(snapshot_path)}\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        replace_durably(temp_path, self.path)
+
+    # Append a command line to the journal
+    def record(self, command_line):
+        record = command_line + "\n"
+        self.file.write(record)
+        self.last = self.size
+        self.size += len(record.encode())
+        self.pending += 1
+        if self.pending >= self.group_size:
+            self.commit()
+
+    # Remove the last record, written ahead of a command that then failed
+    def rollback(self):
+        self.file.truncate(self.last)
+        self.size = self.last
+        if self.pending:
+            self.pending -= 1
+        else:
+            os.fsync(self.file.fileno()) # the record was already committed
+
+    # Make every record written so far durable
+    def commit(self):
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+    # Empty the journal once the snapshot at snapshot_path durably holds all of its effects
+    def checkpoint(self, snapshot_path):
+        self.file.close()
+        self.start(snapshot_path)
+        self.pending = 0
+        self.open()
+
+    def close(self):
+        self.commit()
+        self.file.close()
+
+    # Re-apply the journaled commands to a library restored from restore_path (None for an empty library),
+    # ignoring a torn last record; returns the number replayed. A journal continuing from another snapshot
+    # raises ValueError. Records that fail to parse or to run are skipped and reported on stderr.
+    @staticmethod
+    def replay(library, path, restore_path=None):
+        if not os.path.exists(path):
+            return 0
+        replayed = 0
+        with open(path, "r", encoding="utf-8") as journal_file:
+            for line_number, command_line in enumerate(journal_file, 1):
+                if not command_line.endswith("\n"):
+                    break # incomplete record from a crash mid-write
+                if line_number == 1 and command_line.startswith(JOURNAL_HEADER):
+                    snapshot_path = command_line[len(JOURNAL_HEADER):-1]
+                    if restore_path is None or os.path.abspath(restore_path) != snapshot_path:
+                        raise ValueError(f"journal {path} continues from snapshot {snapshot_path}, "
+                                         f"restore it with --restore")
+                    continue
+                try:
+                    comm, args = parse_line(command_line)
+                    execute_command(library, comm, args)
+                except Exception as err:
+                    print(f"Error: {path}: line {line_number}: skipped {command_line.strip()!r}: {err}",
+                          file=sys.stderr)
+                    continue
+                replayed += 1
+        return replayed
+
+    # The record of a command line: catalog paths are made absolute so that replay does not depend on the
+    # working directory
+    @staticmethod
+    def record_line(command_line, comm, args):
+        if comm == "LoadCatalog":
+            return f'LoadCatalog("{os.path.abspath(args[0])}")'
+        return command_line
+
+
+# Create the library, optionally restoring a snapshot and recovering the journal; returns (library, journal)
+# library_options are the engine, waitlist and cache_size arguments of LibraryManagementSystem
+def open_library(restore_path=None, journal_path=None, group_size=JOURNAL_GROUP_SIZE, **library_options):
+    #Create a LibraryManagementSstem object
+    library = LibraryManagementSystem(**library_options)
+    if restore_path is not None:
+        # Start from a snapshot instead of an empty library
+        library.restore(restore_path)
+    journal = None
+    if journal_path is not None:
+        # Recover the mutations made since the snapshot, then keep journaling
+        Journal.replay(library, journal_path, restore_path)
+        journal = Journal(journal_path, group_size, restore_path)
+    return library, journal
+
+
+# Run one parsed command: journal it if it mutates, time it if statistics are enabled, and return its output line
+def run_command(library, journal, command_line, comm, args):
+    journaled = journal is not None and comm in JOURNALED_COMMANDS
+    if journaled:
+        journal.record(Journal.record_line(command_line, comm, args)) # write ahead of applying the command
+    try:
+        if instrumentation is not None:
+            start = time.perf_counter()
+            output_line = execute_command(library, comm, args)
+            instrumentation.record(comm, time.perf_counter() - start)
+        else:
+            output_line = execute_command(library, comm, args)
+    except Exception:
+        if journaled:
+            journal.rollback() # keep the failed command out of the recovery
+        raise
+    if journaled and comm == "LoadCatalog" and not output_line.startswith(f"Catalog {args[0]} loaded:"):
+        journal.rollback() # the catalog could not be read and nothing changed
+    if journal is not None and comm == "Snapshot" and output_line.startswith("Snapshot saved"):
+        journal.checkpoint(args[0])
+    return output_line
+
+
+# Server responses are framed as a header line "OK <length>" or "ERR <length>" followed by <length> bytes of
+# UTF-8 text: the command output (empty for commands without output) or the error message
+def response_frame(status, text):
+    payload = text.encode()
+    return f"{status} {len(payload)}\n".encode() + payload
+
+
+# Books rendered by a served PrintBooks scan between two yields to the event loop
+SCAN_CHUNK = 256
+
+# Serve the command syntax over TCP ("host:port") or a Unix socket ("unix:path") until interrupted
+# Every client pipelines its commands: all commands go through one queue drained by a single engine task, so
+# mutations are serialized and each client's responses come back in the order of its commands.
+# With a versioned engine, a PrintBooks scan reads the version taken when the engine reached it and is
+# rendered by a task of its own, a chunk at a time, so the commands after it do not wait for the scan.
+async def serve(library, journal, address):
+    requests = asyncio.Queue()
+    scans = set() # running PrintBooks scans, referenced until they finish
+
+    # Render the books of a scan into the response future, yielding to the engine between chunks
+    async def scan_books(books, future):
+        lines = []
+        busy = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                chunk = list(islice(books, SCAN_CHUNK))
+                busy += time.perf_counter() - start
+                lines.extend(chunk)
+                if len(chunk) < SCAN_CHUNK:
+                    break
+                await asyncio.sleep(0)
+        except Exception as err:
+            future.set_exception(err)
+            return
+        if instrumentation is not None:
+            instrumentation.record("PrintBooks", busy)
+        future.set_result(format_books(lines))
 
-    # Write output to a text file
+    # The only task changing the library
+    async def engine():
+        while True:
+            command_line, comm, args, future = await requests.get()
+            if comm == "PrintBooks" and library.versioned:
+                scan = asyncio.create_task(scan_books(library.print_books(*args), future))
+                scans.add(scan)
+                scan.add_done_callback(scans.discard)
+                continue
+            try:
+                output_line = run_command(library, journal, command_line, comm, args)
+            except Exception as err:
+                future.set_exception(err)
+            else:
+                future.set_result("" if output_line is None else str(output_line))
+
+    async def handle_client(reader, writer):
+        responses = asyncio.Queue() # futures of this client's commands, in order
+
+        # Write the responses in command order, draining only when no response is ready
+        async def respond():
+            while True:
+                future = await responses.get()
+                if future is None:
+                    break
+                try:
+                    writer.write(response_frame("OK", await future))
+                except Exception as err:
+                    writer.write(response_frame("ERR", str(err)))
+                if responses.empty():
+                    await writer.drain()
+
+        loop = asyncio.get_running_loop()
+        responder = asyncio.create_task(respond())
+        try:
+            while True:
+                raw_line = await reader.readline()
+                if not raw_line:
+                    break
+                l = raw_line.decode().strip()
+                if not l:
+                    continue
+                future = loop.create_future()
+                responses.put_nowait(future)
+                if l == "Quit()": # ends this client's session only
+                    future.set_result("Program Terminated!!")
+                    break
+                try:
+                    comm, args = parse_line(l)
+                except CommandError as err:
+                    future.set_exception(err)
+                    continue
+                requests.put_nowait((l, comm, args, future))
+        finally:
+            responses.put_nowait(None)
+            await responder
+            writer.close()
+            await writer.wait_closed()
+
+    engine_task = asyncio.create_task(engine())
+    if address.startswith("unix:"):
+        server = await asyncio.start_unix_server(handle_client, path=address[len("unix:"):])
+    else:
+        host, port = address.rsplit(":", 1)
+        server = await asyncio.start_server(handle_client, host, int(port))
     try:
-        # Create output file based on the input filename
-        output_filename = splitext(input_file_name)[0] + "_output_file.txt"
+        async with server:
+            await server.serve_forever()
+    finally:
+        engine_task.cancel()
+
+
+# Sharded mode: the bookId space is split into contiguous ranges, each owned by a worker process holding its
+# own LibraryManagementSystem. A router in the main process sends commands on one book to the owning shard and
+# splits commands over ranges or patrons into one operation per shard, merging the partial results.
+# Operations are sent in batches and results are read back lazily, so all shards work concurrently while
+# outputs are still produced in command order. Each shard runs its operations in submission order, so every
+# command sees exactly the effects of the commands before it, as in the single-process mode.
+
+# Default bookIds partitioned evenly across the shards; larger bookIds all belong to the last shard
+SHARD_BOOK_RANGE = 1 << 20
+# Operations sent to a shard per message
+SHARD_BATCH_SIZE = 256
+# Commands on one book: command name -> index of the bookId argument
+SHARD_BOOK_ARG = dict(BATCH_BOOK_ARG, InsertBook=0, DeleteBook=0, CancelReservation=1, WaitlistPosition=1)
+
+
+# Shard side of FindClosestBook: the closest lower and higher books of this shard as (bookId, details) or None
+def shard_closest(library, target):
+    return tuple(None if node is None else (node.val.bookId, library.get_book_details(node))
+                 for node in library.findClosestBookHelper(target))
+
+# Shard side of FindClosestBooks: this shard's k nearest books as (bookId, details)
+def shard_closest_books(library, target, k):
+    return [(node.val.bookId, node.val.render()) for node in library.bookTree.closest(target, k)]
+
+def shard_print_books(library, book_id1, book_id2, limit=None, after=None):
+    return list(library.print_books(book_id1, book_id2, limit, after))
+
+def shard_count_range(library, book_id1, book_id2):
+    return library.bookTree.count_range(book_id1, book_id2)
+
+def shard_size(library):
+    return len(library.bookTree)
 
-        # Write the output content to the output file
-        with open(output_filename, 'w') as output_file:
-            for l in output_lines:
-                output_file.write(str(l) + '\n')
+def shard_rank(library, bookId):
+    return library.bookTree.rank(bookId)
+
+def shard_select(library, k):
+    return library.get_book_details(library.bookTree.select(k))
+
+def shard_search_by_author(library, name):
+    return library.search_by_author(name)
+
+def shard_search_title(library, query):
+    return library.search_title(query)
+
+def shard_patron(library, patronId):
+    patron = library.patrons.get(patronId)
+    return (list(patron.borrowed), list(patron.reserved)) if patron is not None else ([], [])
+
+def shard_cache_stats(library):
+    cache = library.bookCache
+    return (cache.hits, cache.misses, len(cache), cache.capacity) if cache is not None else None
+
+def shard_overdue(library, now):
+    return library.overdue_loans(now)
+
+def shard_advance_clock(library, t):
+    return library.advance_clock(t)
+
+# Every shard reads the whole catalog file and keeps the books of its own range
+# (an unreadable catalog gives the error line instead of the number of books added)
+def shard_load_catalog(library, path, low, high):
+    before = len(library.bookTree)
+    opLine = library.load_catalog(path, low, high)
+    if not opLine.startswith(f"Catalog {path} loaded:"):
+        return opLine
+    return len(library.bookTree) - before
+
+
+# Operations run by the shard workers: name -> function(library, *args)
+SHARD_OPERATIONS = {
+    "command": execute_command,
+    "print_books": shard_print_books,
+    "closest": shard_closest,
+    "closest_books": shard_closest_books,
+    "count_range": shard_count_range,
+    "size": shard_size,
+    "rank": shard_rank,
+    "select": shard_select,
+    "patron": shard_patron,
+    "search_by_author": shard_search_by_author,
+    "search_title": shard_search_title,
+    "load_catalog": shard_load_catalog,
+    "overdue": shard_overdue,
+    "cache_stats": shard_cache_stats,
+    "advance_clock": shard_advance_clock,
+}
+
+
+# Worker process main loop: run batches of operations, answering each batch with the list of results
+# An operation that raises answers with the exception, which the router raises again
+def shard_worker(requests, responses, library_options):
+    library = LibraryManagementSystem(**library_options)
+    while True:
+        batch = requests.get()
+        if batch is None:
+            break
+        results = []
+        for operation in batch:
+            try:
+                results.append(SHARD_OPERATIONS[operation[0]](library, *operation[1:]))
+            except Exception as err:
+                results.append(err)
+        responses.put(results)
+
+
+# Class for the router of the sharded mode
+# library_options are the engine, waitlist and cache_size arguments of the LibraryManagementSystem of each shard
+class ShardedLibrary:
+    def __init__(self, shards, book_range=SHARD_BOOK_RANGE, batch_size=SHARD_BATCH_SIZE, **library_options):
+        self.bounds = [1 + shard * book_range // shards for shard in range(1, shards)] # lowest bookId of shards 1..
+        self.batch_size = batch_size
+        self.requests = []
+        self.responses = []
+        self.workers = []
+        self.outgoing = [[] for _ in range(shards)] # operations not sent yet, per shard
+        self.received = [deque() for _ in range(shards)] # results not consumed yet, per shard
+        # Submitted commands without output yet, in order: the shard of a command on one book, otherwise (combine, shards)
+        self.pending = deque()
+        self.completed = deque() # outputs of commands resolved early, ahead of the pending ones
+        for _ in range(shards):
+            requests, responses = multiprocessing.Queue(), multiprocessing.Queue()
+            worker = multiprocessing.Process(target=shard_worker, daemon=True,
+                                             args=(requests, responses, library_options))
+            worker.start()
+            self.requests.append(requests)
+            self.responses.append(responses)
+            self.workers.append(worker)
+
+    # Index of the shard owning a bookId
+    def shard_of(self, bookId):
+        return bisect_right(self.bounds, bookId)
+
+    # bookId range (low, high) of a shard, None for an unbounded side
+    def shard_range(self, shard):
+        low = self.bounds[shard - 1] if shard > 0 else None
+        high = self.bounds[shard] - 1 if shard < len(self.bounds) else None
+        return low, high
+
+    # Shards whose range overlaps book_id1 to book_id2
+    def shards_between(self, book_id1, book_id2):
+        if book_id1 > book_id2:
+            return [0] # empty range, one shard gives the empty answer
+        return list(range(self.shard_of(book_id1), self.shard_of(book_id2) + 1))
+
+    # Queue one operation per (shard, operation) part; combine turns the list of their results into the output
+    def dispatch(self, parts, combine):
+        for shard, operation in parts:
+            outgoing = self.outgoing[shard]
+            outgoing.append(operation)
+            if len(outgoing) >= self.batch_size:
+                self.send(shard)
+        self.pending.append((combine, [shard for shard, _ in parts]))
+
+    # Send the queued operations of a shard
+    def send(self, shard):
+        if self.outgoing[shard]:
+            self.requests[shard].put(self.outgoing[shard])
+            self.outgoing[shard] = []
+
+    # Next result of a shard, waiting for it if needed
+    def next_result(self, shard):
+        received = self.received[shard]
+        if not received:
+            self.send(shard)
+            received.extend(self.responses[shard].get())
+        result = received.popleft()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    # Resolve the oldest pending command
+    def resolve(self):
+        entry = self.pending.popleft()
+        if entry.__class__ is int:
+            return self.next_result(entry)
+        combine, shards = entry
+        return combine([self.next_result(shard) for shard in shards])
+
+    # Run one operation on a shard synchronously; only valid once no command is pending
+    def call(self, shard, operation):
+        self.outgoing[shard].append(operation)
+        return self.next_result(shard)
+
+    # Submit a parsed command; its output is produced later by collect()
+    def submit(self, comm, args):
+        book_arg = SHARD_BOOK_ARG.get(comm)
+        if book_arg is not None:
+            # Fast path for the common case of a command on one book
+            shard = bisect_right(self.bounds, args[book_arg])
+            outgoing = self.outgoing[shard]
+            outgoing.append(("command", comm, args))
+            if len(outgoing) >= self.batch_size:
+                self.send(shard)
+            self.pending.append(shard)
+            return
+        router = SHARD_ROUTERS.get(comm)
+        if router is None:
+            raise CommandError(f"{comm} is not supported in sharded mode")
+        router(self, *args)
+
+    # Yield the outputs of the submitted commands in order, until at most keep commands are pending
+    def collect(self, keep=0):
+        while self.completed:
+            yield self.completed.popleft()
+        while len(self.pending) > keep:
+            yield self.resolve()
+
+    # Stop the workers
+    def close(self):
+        for requests in self.requests:
+            requests.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def route_print_books(self, book_id1, book_id2, limit=None, after=None):
+        def combine(results):
+            books = [book for shard_books in results for book in shard_books]
+            return format_books(books[:limit] if limit is not None else books)
+        operation = ("print_books", book_id1, book_id2, limit, after)
+        self.dispatch([(shard, operation) for shard in self.shards_between(book_id1, book_id2)], combine)
+
+    # The closest books may be in any shard when the shards near the target are empty, so every shard
+    # answers with its closest lower and higher book and the nearest of them are kept
+    def route_find_closest_book(self, target):
+        def combine(results):
+            lower = max((closest[0] for closest in results if closest[0] is not None), default=None)
+            higher = min((closest[1] for closest in results if closest[1] is not None), default=None)
+            if lower is not None and higher is not None:
+                distance_lower, distance_higher = target - lower[0], higher[0] - target
+                if lower[0] == higher[0] or distance_lower < distance_higher:
+                    books = [lower[1]]
+                elif distance_higher < distance_lower:
+                    books = [higher[1]]
+                else:
+                    books = [lower[1], higher[1]]
+            else:
+                books = [closest[1] for closest in (lower, higher) if closest is not None]
+            return format_books(books)
+        self.dispatch([(shard, ("closest", target)) for shard in range(len(self.workers))], combine)
+
+    # The k nearest books overall are among the k nearest of each shard
+    def route_find_closest_books(self, target, k):
+        def combine(results):
+            nearest = sorted((book for books in results for book in books),
+                             key=lambda book: (abs(book[0] - target), book[0]))[:max(k, 0)]
+            return format_books([details for _, details in sorted(nearest)])
+        self.dispatch([(shard, ("closest_books", target, k)) for shard in range(len(self.workers))], combine)
+
+    def route_count_books(self, book_id1, book_id2):
+        operation = ("count_range", book_id1, book_id2)
+        self.dispatch([(shard, operation) for shard in self.shards_between(book_id1, book_id2)],
+                      lambda results: f"Book Count: {sum(count for count, _ in results)}")
+
+    def route_count_available(self, book_id1, book_id2):
+        operation = ("count_range", book_id1, book_id2)
+        self.dispatch([(shard, operation) for shard in self.shards_between(book_id1, book_id2)],
+                      lambda results: f"Available Book Count: {sum(available for _, available in results)}")
+
+    # Rank within the owning shard plus the sizes of the shards below it
+    def route_book_rank(self, bookId):
+        def combine(results):
+            if results[-1] is None:
+                return f"Book {bookId} not found."
+            return f"Book {bookId} has rank {sum(results[:-1]) + results[-1]}"
+        owner = self.shard_of(bookId)
+        self.dispatch([(shard, ("size",)) for shard in range(owner)] + [(owner, ("rank", bookId))], combine)
+
+    # Finding the shard of the k-th book needs the current shard sizes, so the pipeline is drained first
+    def route_kth_book(self, k):
+        while self.pending:
+            self.completed.append(self.resolve())
+        output_line = f"No book at rank {k}."
+        if k >= 1:
+            for shard in range(len(self.workers)):
+                size = self.call(shard, ("size",))
+                if k <= size:
+                    output_line = self.call(shard, ("select", k))
+                    break
+                k -= size
+        self.dispatch([], lambda results: output_line)
+
+    def route_patron_status(self, patronId):
+        def combine(results):
+            return LibraryManagementSystem.format_patron_status(
+                patronId, sorted(bookId for borrowed, _ in results for bookId in borrowed),
+                sorted(bookId for _, reserved in results for bookId in reserved))
+        self.dispatch([(shard, ("patron", patronId)) for shard in range(len(self.workers))], combine)
+
+    # Shards hold disjoint bookId ranges in order, so concatenating their matches keeps bookId order
+    def route_search_by_author(self, name):
+        self.dispatch([(shard, ("search_by_author", name)) for shard in range(len(self.workers))],
+                      lambda results: format_books([book for books in results for book in books])
+                      or f"No books found for Author {name}.")
+
+    def route_search_title(self, query):
+        self.dispatch([(shard, ("search_title", query)) for shard in range(len(self.workers))],
+                      lambda results: format_books([book for books in results for book in books])
+                      or f"No books found for Title {query}.")
+
+    # Every shard keeps its own copy of the clock and the loans of its books; due-ordered lists are merged
+    def route_overdue(self, now):
+        self.dispatch([(shard, ("overdue", now)) for shard in range(len(self.workers))],
+                      lambda results: format_loans(heapq.merge(*results)) or "No overdue loans.")
+
+    def route_advance_clock(self, t):
+        def combine(results):
+            if results[0] is None:
+                return format_clock_advance(t, None)
+            return format_clock_advance(t, list(heapq.merge(*results)))
+        self.dispatch([(shard, ("advance_clock", t)) for shard in range(len(self.workers))], combine)
+
+    # Every shard caches the hot books of its own range
+    def route_cache_stats(self):
+        def combine(results):
+            if results[0] is None:
+                return "Book cache is disabled."
+            return LibraryManagementSystem.format_cache_stats(*(sum(column) for column in zip(*results)))
+        self.dispatch([(shard, ("cache_stats",)) for shard in range(len(self.workers))], combine)
+
+    # Each shard rebalances its own tree, so their flips do not add up to those of one tree over all the books
+    def route_color_flip_count(self):
+        self.dispatch([], lambda results: "Colour Flip Count: not tracked in sharded mode")
+
+    def route_load_catalog(self, path):
+        def combine(results):
+            for result in results:
+                if isinstance(result, str):
+                    return result # every shard reads the whole file, so they all fail alike
+            return f"Catalog {path} loaded: {sum(results)} books added"
+        self.dispatch([(shard, ("load_catalog", path, *self.shard_range(shard))) for shard in range(len(self.workers))],
+                      combine)
+
+
+# Routers of the sharded commands that do not concern a single book
+SHARD_ROUTERS = {
+    "PrintBooks": ShardedLibrary.route_print_books,
+    "FindClosestBook": ShardedLibrary.route_find_closest_book,
+    "FindClosestBooks": ShardedLibrary.route_find_closest_books,
+    "CountBooks": ShardedLibrary.route_count_books,
+    "CountAvailable": ShardedLibrary.route_count_available,
+    "BookRank": ShardedLibrary.route_book_rank,
+    "KthBook": ShardedLibrary.route_kth_book,
+    "PatronStatus": ShardedLibrary.route_patron_status,
+    "LoadCatalog": ShardedLibrary.route_load_catalog,
+    "SearchByAuthor": ShardedLibrary.route_search_by_author,
+    "SearchTitle": ShardedLibrary.route_search_title,
+    "Overdue": ShardedLibrary.route_overdue,
+    "AdvanceClock": ShardedLibrary.route_advance_clock,
+    "CacheStats": ShardedLibrary.route_cache_stats,
+    "ColorFlipCount": ShardedLibrary.route_color_flip_count,
+}
+
+
+# Run a command file with a ShardedLibrary, writing the results like main()
+def run_sharded(file, output_file, router, quiet=False):
+    window = router.batch_size * len(router.workers) * 4 # commands in flight before outputs are written
+    terminated = False
+    for line_number, l in enumerate(file, 1):
+        l = l.strip()
+        if l == "Quit()":
+            terminated = True
+            break
+        if not l:
+            continue
+        try:
+            comm, args = parse_line(l)
+            router.submit(comm, args)
+        except CommandError as err:
+            print(f"Error: line {line_number}: {err}", file=sys.stderr)
+            continue
+        if not quiet:
+            print(comm)
+        if len(router.pending) > window:
+            for output_line in router.collect(keep=window // 2):
+                if output_line is not None:
+                    output_file.write(str(output_line) + "\n\n\n")
+    for output_line in router.collect():
+        if output_line is not None:
+            output_file.write(str(output_line) + "\n\n\n")
+    if terminated:
+        output_file.write("Program Terminated!!\n")
+
+
+def main(input_file_name, quiet=False, restore_path=None, journal_path=None, group_size=JOURNAL_GROUP_SIZE,
+         batch_size=0, stats_path=None, serve_address=None, shards=0, book_range=SHARD_BOOK_RANGE, waitlist=None,
+         engine=None, book_cache=BOOK_CACHE_SIZE, mapped=False):
+    global instrumentation
+    library_options = {
+        "engine": TREE_ENGINES[engine] if engine is not None else DEFAULT_ENGINE,
+        "waitlist": WAITLIST_BACKENDS[waitlist] if waitlist is not None else DEFAULT_WAITLIST,
+        "cache_size": book_cache,
+    }
+    if shards:
+        # Partition the books across worker processes
+        file = nullcontext(sys.stdin) if input_file_name == "-" else open(input_file_name, "r")
+        with file as file, open_output(input_file_name) as output_file:
+            router = ShardedLibrary(shards, book_range, **library_options)
+            try:
+                run_sharded(file, output_file, router, quiet or input_file_name == "-")
+            finally:
+                router.close()
+        return
+    if stats_path is not None:
+        instrumentation = Instrumentation(stats_path)
+    try:
+        library, journal = open_library(restore_path, journal_path, group_size, **library_options)
+    except (OSError, ValueError) as err:
+        print(f"Error: {err}")
+        return
+    if serve_address is not None:
+        # Long-running server instead of a command file
+        try:
+            asyncio.run(serve(library, journal, serve_address))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if journal is not None:
+                journal.close()
+            if instrumentation is not None:
+                instrumentation.write(library)
+        return
+    # Read input from the passed file (input.txt), memory-mapped if asked, or from stdin if the name is "-"
+    if input_file_name == "-":
+        file = nullcontext(sys.stdin)
+        commands = read_commands(sys.stdin)
+        quiet = True # The debug echo would be interleaved with the results on stdout
+    elif mapped:
+        file = open(input_file_name, "rb")
+        commands = mapped_commands(file, JOURNALED_COMMANDS if journal is not None else ())
+    else:
+        file = open(input_file_name, "r")
+        commands = read_commands(file)
+    try:
+        output_file = open_output(input_file_name)
     #Exception handling
     except Exception as err:
         print(f"Error: {err}")
+        if input_file_name != "-":
+            file.close()
+        return
+    with file as file, output_file as output_file, closing(commands):
+        # Runs of consecutive BorrowBook/ReturnBook/PrintBook commands collected for execute_batch
+        batch = []
+
+        # Execute the collected batch and write its results in command order
+        def flush_batch():
+            if not batch:
+                return
+            start = time.perf_counter()
+            output_lines = library.execute_batch(batch)
+            if instrumentation is not None:
+                # Batched commands are timed together, each is recorded with the average latency
+                average = (time.perf_counter() - start) / len(batch)
+                for comm, _ in batch:
+                    instrumentation.record(comm, average)
+            for output_line in output_lines:
+                output_file.write(str(output_line) + "\n\n\n")
+            batch.clear()
+
+        # Stream the commands line by line, writing each result as soon as it is produced
+        for line_number, l, comm, args in commands:
+            if comm == "Quit": #check for quit and handle
+                flush_batch()
+                output_file.write("Program Terminated!!\n")
+                break
+            if not quiet:
+                print(comm)
+            if batch_size and comm in BATCH_BOOK_ARG:
+                if journal is not None and comm in JOURNALED_COMMANDS:
+                    journal.record(l) # write ahead of applying the command
+                batch.append((comm, args))
+                if len(batch) >= batch_size:
+                    flush_batch()
+                continue
+            flush_batch()
+            output_line = run_command(library, journal, l, comm, args)
+
+            if output_line is not None:
+                #Write the result followed by the blank separator lines
+                output_file.write(str(output_line) + "\n\n\n")
+        flush_batch()
+    if journal is not None:
+        journal.close()
+    if instrumentation is not None:
+        instrumentation.write(library)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Use Syntax: python3 gator.py input_file_name")
-        sys.exit(1)
-    input_file_name = sys.argv[1]
-    main(input_file_name)
+    parser = argparse.ArgumentParser(description="GatorLibrary Management System")
+    parser.add_argument("input_file_name", nargs="?",
+                        help='command file to execute, or "-" to read commands from stdin')
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not echo each command to the console")
+    parser.add_argument("--restore", metavar="path", help="start from a snapshot written by Snapshot(path)")
+    parser.add_argument("--journal", metavar="path",
+                        help="replay this write-ahead journal on startup and append mutating commands to it")
+    parser.add_argument("--group-commit", type=int, default=JOURNAL_GROUP_SIZE, metavar="N",
+                        help="journal records per fsync (default %(default)s)")
+    parser.add_argument("--batch", type=int, default=0, metavar="N",
+                        help="serve up to N consecutive BorrowBook/ReturnBook/PrintBook commands as one sorted batch")
+    parser.add_argument("--stats", metavar="path",
+                        help="collect latency and tree statistics, written at exit and on Stats() "
+                             "(JSON for a .json path, Prometheus text otherwise)")
+    parser.add_argument("--serve", metavar="address",
+                        help='run as a server on "host:port" or "unix:path" instead of executing a command file')
+    parser.add_argument("--shards", type=int, default=0, metavar="N",
+                        help="partition the books by bookId range across N worker processes")
+    parser.add_argument("--book-range", type=int, default=SHARD_BOOK_RANGE, metavar="M",
+                        help="bookIds 1..M are split evenly across the shards, larger ones go to the last shard "
+                             "(default %(default)s)")
+    parser.add_argument("--waitlist", choices=sorted(WAITLIST_BACKENDS), default=None,
+                        help="priority queue used for the book waitlists (default heapq)")
+    parser.add_argument("--engine", choices=sorted(TREE_ENGINES), default=None,
+                        help="ordered map storing the books: rb (red-black tree, the default), chunked "
+                             "(sorted chunks) or persistent (path-copying tree whose PrintBooks scans read a "
+                             "version while writes continue); only rb reports color flips")
+    parser.add_argument("--book-cache", type=int, default=BOOK_CACHE_SIZE, metavar="N",
+                        help="capacity of the hot-book lookup cache, 0 to disable (default %(default)s)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="read the command file through the memory-mapped reader instead of line by line")
+    cli_args = parser.parse_args()
+    if (cli_args.input_file_name is None) == (cli_args.serve is None):
+        parser.error("give either an input file or --serve address")
+    if cli_args.shards and (cli_args.serve or cli_args.restore or cli_args.journal or cli_args.batch or cli_args.stats):
+        parser.error("--shards cannot be combined with --serve, --restore, --journal, --batch or --stats")
+    main(cli_args.input_file_name, cli_args.quiet, cli_args.restore, cli_args.journal, cli_args.group_commit,
+         cli_args.batch, cli_args.stats, cli_args.serve, cli_args.shards, cli_args.book_range, cli_args.waitlist,
+         cli_args.engine, cli_args.book_cache, cli_args.mmap)
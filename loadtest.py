@@ -0,0 +1,110 @@
+# File: loadtest.py
+# Load-test client for the GatorLibrary server mode
+
+'''
+Opens many concurrent connections to a server started with gatorLibrary.py --serve, pipelines a generated
+workload on each and reports the overall throughput.
+Run as: python3 loadtest.py [--connections 200] [--commands 500] [--books 10000] [--address host:port]
+Without --address a server is started on a free localhost port for the duration of the test.
+'''
+
+# Import necessary modules
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from workload import catalog_lines, generate
+
+# Commands sent by each connection
+CIRCULATION_MIX = {"BorrowBook": 45, "ReturnBook": 40, "PrintBook": 15}
+
+
+# Open a connection to a "host:port" or "unix:path" address
+async def connect(address):
+    if address.startswith("unix:"):
+        return await asyncio.open_unix_connection(address[len("unix:"):])
+    host, port = address.rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port))
+
+
+# Read one framed response; returns (status, text)
+async def read_response(reader):
+    status, length = (await reader.readline()).decode().split()
+    return status, (await reader.readexactly(int(length))).decode()
+
+
+# Send all commands without waiting, then read every response; returns the number of error responses
+async def run_client(address, commands):
+    reader, writer = await connect(address)
+    writer.write("".join(command + "\n" for command in commands).encode())
+    await writer.drain()
+    errors = 0
+    for _ in commands:
+        status, _ = await read_response(reader)
+        errors += status != "OK"
+    writer.close()
+    await writer.wait_closed()
+    return errors
+
+
+async def load_test(address, connections, commands_per_connection, books, catalog_path):
+    # Seed the catalog through one connection
+    await run_client(address, [f'LoadCatalog("{catalog_path}")'])
+    workloads = [list(generate(books, commands_per_connection, CIRCULATION_MIX, seed=client))
+                 for client in range(connections)]
+    start = time.perf_counter()
+    errors = await asyncio.gather(*(run_client(address, workload) for workload in workloads))
+    elapsed = time.perf_counter() - start
+    total = connections * commands_per_connection
+    print(f"connections={connections} commands={total} errors={sum(errors)}")
+    print(f"elapsed: {elapsed:.2f}s throughput: {total / elapsed:,.0f} commands/s")
+
+
+# Wait until the server accepts connections
+def wait_for_server(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GatorLibrary server load test")
+    parser.add_argument("--address", help='server address, "host:port" or "unix:path" (default: start a server)')
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=500, help="commands per connection")
+    parser.add_argument("--books", type=int, default=10000, help="catalog size")
+    cli_args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        catalog_path = os.path.join(directory, "catalog.txt")
+        with open(catalog_path, "w") as catalog_file:
+            for line in catalog_lines(cli_args.books):
+                catalog_file.write(line + "\n")
+
+        server = None
+        address = cli_args.address
+        if address is None:
+            with socket.socket() as probe:
+                probe.bind(("127.0.0.1", 0))
+                port = probe.getsockname()[1]
+            address = f"127.0.0.1:{port}"
+            script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gatorLibrary.py")
+            server = subprocess.Popen([sys.executable, script, "--serve", address])
+            wait_for_server("127.0.0.1", port)
+        try:
+            asyncio.run(load_test(address, cli_args.connections, cli_args.commands, cli_args.books, catalog_path))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
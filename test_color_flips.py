@@ -0,0 +1,93 @@
+# File: test_color_flips.py
+# Differential test of the incremental delete color flip counter of RedBlackTree
+
+'''
+RedBlackTree.delete counts the nodes whose color changed during a deletion as it recolors them.
+These tests check it against the original counter, which took a breadth-first snapshot of every node color
+before and after the deletion and counted the bookIds whose color differs.
+Run as: python3 -m unittest test_color_flips
+'''
+
+# Import necessary modules
+import random
+import unittest
+
+from gatorLibrary import BookNode, RedBlackTree
+
+
+# Colors of all the nodes of a tree by bookId
+def color_snapshot(tree):
+    colors = {}
+    queue = [tree.root] if tree.root != tree.nil else []
+    while queue:
+        node = queue.pop()
+        colors[node.val.bookId] = 1 if node.red else 0
+        if node.left != tree.nil:
+            queue.append(node.left)
+        if node.right != tree.nil:
+            queue.append(node.right)
+    return colors
+
+
+# Delete bookId and return the number of color flips by the snapshot diff of the original implementation
+def reference_delete(tree, bookId):
+    before = color_snapshot(tree)
+    tree.delete(bookId)
+    after = color_snapshot(tree)
+    return sum(1 for bookId, color in after.items() if before[bookId] != color)
+
+
+def make_book(bookId):
+    return BookNode(bookId, f'"Title {bookId}"', f'"Author {bookId}"', '"Yes"')
+
+
+class DeleteColorFlipTest(unittest.TestCase):
+    # Apply random inserts and deletes, comparing the counted flips of each delete with the snapshot diff
+    def check_random_operations(self, seed, operations, max_id, tree=None):
+        rng = random.Random(seed)
+        tree = tree if tree is not None else RedBlackTree()
+        for _ in range(operations):
+            bookId = rng.randint(1, max_id)
+            if rng.random() < 0.55:
+                if tree.find(bookId) is None:
+                    tree.insert(make_book(bookId))
+            else:
+                counted = tree.color_flip_count
+                expected = reference_delete(tree, bookId)
+                self.assertEqual(tree.color_flip_count - counted, expected,
+                                 f"seed {seed}: delete of bookId {bookId}")
+
+    def test_random_inserts_and_deletes(self):
+        for seed in range(40):
+            with self.subTest(seed=seed):
+                self.check_random_operations(seed, 3000, 300)
+
+    def test_sparse_keys(self):
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                self.check_random_operations(seed, 3000, 100000)
+
+    def test_deletes_after_bulk_load(self):
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                tree = RedBlackTree()
+                tree.bulk_load([make_book(bookId) for bookId in range(1, 1001)])
+                self.check_random_operations(seed, 3000, 1200, tree)
+
+    def test_delete_until_empty(self):
+        rng = random.Random(7)
+        tree = RedBlackTree()
+        bookIds = list(range(1, 513))
+        for bookId in bookIds:
+            tree.insert(make_book(bookId))
+        rng.shuffle(bookIds)
+        for bookId in bookIds:
+            counted = tree.color_flip_count
+            expected = reference_delete(tree, bookId)
+            self.assertEqual(tree.color_flip_count - counted, expected)
+        self.assertEqual(len(tree), 0)
+        self.assertGreater(tree.color_flip_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+# File: test_persistent_tree.py
+# Tests of the persistent book map engine and its version handles
+
+'''
+PersistentRedBlackTree is checked against a dictionary of the expected books after random inserts, deletes and
+book changes, together with the left-leaning red-black invariants and the subtree counters. Versions taken along
+the way must keep reporting the books, and the book fields, they held when they were taken.
+Run as: python3 -m unittest test_persistent_tree
+'''
+
+# Import necessary modules
+import random
+import unittest
+
+from gatorLibrary import BookNode, LibraryManagementSystem, PersistentRedBlackTree, RedBlackTree
+
+
+def make_book(bookId):
+    return BookNode(bookId, f'"Title {bookId}"', f'"Author {bookId}"', '"Yes"')
+
+
+# Black height of a subtree, failing the test case if a left-leaning red-black invariant or a counter is wrong
+def check_subtree(test, node):
+    if node is None:
+        return 0
+    test.assertFalse(node.right is not None and node.right.red, f"red right child under {node.val.bookId}")
+    test.assertFalse(node.red and node.left is not None and node.left.red, f"red-red at {node.val.bookId}")
+    if node.left is not None:
+        test.assertLess(node.left.val.bookId, node.val.bookId)
+    if node.right is not None:
+        test.assertGreater(node.right.val.bookId, node.val.bookId)
+    left_height = check_subtree(test, node.left)
+    test.assertEqual(left_height, check_subtree(test, node.right), f"black height at {node.val.bookId}")
+    sizes = [child.size for child in (node.left, node.right) if child is not None]
+    available = [child.available for child in (node.left, node.right) if child is not None]
+    test.assertEqual(node.size, sum(sizes) + 1)
+    test.assertEqual(node.available, sum(available) + (node.val.isAvailable == '"Yes"'))
+    return left_height + (not node.red)
+
+
+# (bookId, availability) of every book of a tree or version, in order
+def contents(tree):
+    return [(node.val.bookId, node.val.isAvailable) for node in tree.range_scan(float("-inf"), float("inf"))]
+
+
+class PersistentTreeTest(unittest.TestCase):
+    def check_tree(self, tree, expected):
+        self.assertFalse(tree.root is not None and tree.root.red)
+        check_subtree(self, tree.root)
+        self.assertEqual(contents(tree), sorted(expected.items()))
+        self.assertEqual(len(tree), len(expected))
+
+    # Random inserts, deletes and availability changes, taking versions now and then and checking them at the end
+    def check_random_operations(self, seed, operations, max_id, tree):
+        rng = random.Random(seed)
+        expected = {node.val.bookId: node.val.isAvailable for node in tree.range_scan(0, max_id)}
+        versions = []
+        for _ in range(operations):
+            bookId = rng.randint(1, max_id)
+            roll = rng.random()
+            if roll < 0.45:
+                if tree.insert(make_book(bookId)) is not None:
+                    expected[bookId] = '"Yes"'
+            elif roll < 0.8:
+                tree.delete(bookId)
+                expected.pop(bookId, None)
+            elif tree.find(bookId) is not None:
+                node = tree.writable(tree.find(bookId))
+                node.val.isAvailable = '"No"' if node.val.isAvailable == '"Yes"' else '"Yes"'
+                tree.availability_changed(node)
+                expected[bookId] = node.val.isAvailable
+            if rng.random() < 0.05:
+                versions.append((tree.version(), sorted(expected.items())))
+        self.check_tree(tree, expected)
+        for version, books in versions:
+            self.assertEqual(contents(version), books)
+            self.assertEqual(len(version), len(books))
+            self.assertEqual(version.count_range(1, max_id)[1], sum(available == '"Yes"' for _, available in books))
+
+    def test_random_operations(self):
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                self.check_random_operations(seed, 2000, 300, PersistentRedBlackTree())
+
+    def test_operations_after_bulk_load(self):
+        for seed, books in enumerate((1, 2, 3, 7, 8, 26, 27, 100, 1000)):
+            with self.subTest(books=books):
+                tree = PersistentRedBlackTree()
+                tree.bulk_load([make_book(bookId) for bookId in range(1, books + 1)])
+                self.check_tree(tree, {bookId: '"Yes"' for bookId in range(1, books + 1)})
+                self.check_random_operations(seed, 2000, books + 200, tree)
+
+    # The queries answered from a version agree with the red-black engine on the same books
+    def test_queries_match_the_red_black_engine(self):
+        rng = random.Random(3)
+        libraries = [LibraryManagementSystem(engine) for engine in (RedBlackTree, PersistentRedBlackTree)]
+        bookIds = rng.sample(range(1, 2000), 600)
+        for library in libraries:
+            for bookId in bookIds:
+                library.insert_book(bookId, '"Title"', '"Author"', '"Yes"')
+            for bookId in bookIds[::3]:
+                library.borrow_book(1, bookId, 1)
+        for _ in range(200):
+            target = rng.randint(0, 2100)
+            low, high = sorted((rng.randint(0, 2100), rng.randint(0, 2100)))
+            results = [(library.find_closest_books(target, 5), library.count_books(low, high),
+                        library.count_available(low, high), library.book_rank(target), library.kth_book(target // 4),
+                        list(library.print_books(low, high, 7, target)))
+                       for library in libraries]
+            self.assertEqual(results[0], results[1])
+
+    # A PrintBooks scan started before a change reports the library as it was when the scan started
+    def test_print_books_reads_a_version(self):
+        library = LibraryManagementSystem(PersistentRedBlackTree)
+        for bookId in range(1, 11):
+            library.insert_book(bookId, f'"Title {bookId}"', '"Author"', '"Yes"')
+        scan = library.print_books(1, 10)
+        first = next(scan)
+        library.borrow_book(7, 5, 1)
+        library.borrow_book(8, 5, 2)
+        library.delete_book(9)
+        library.insert_book(11, '"Title 11"', '"Author"', '"Yes"')
+        books = [first, *scan]
+        self.assertEqual(len(books), 10)
+        self.assertIn("BookID = 9\n", books[8])
+        self.assertIn("Availability = \"Yes\"\nBorrowedBy = None\nReservations = []", books[4])
+        self.assertIn("Availability = \"No\"\nBorrowedBy = 7\nReservations = [8]", library.print_book(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# File: workload.py
+# Synthetic workload generator for the GatorLibrary Management System
+
+'''
+Generates command files for gatorLibrary.py with a configurable catalog size, bookId distribution
+(uniform or Zipfian) and command mix.
+Run as: python3 workload.py --books N --operations M [--distribution zipf] [--mix InsertBook=5,BorrowBook=40,...]
+        [--catalog catalog.txt] -o commands.txt
+'''
+
+# Import necessary modules
+import argparse
+import bisect
+import itertools
+import math
+import random
+
+# Default relative frequency of each command
+DEFAULT_MIX = {
+    "InsertBook": 5,
+    "BorrowBook": 40,
+    "ReturnBook": 30,
+    "DeleteBook": 5,
+    "PrintBooks": 5,
+    "FindClosestBook": 5,
+    "PrintBook": 10,
+}
+# Number of bookIds covered by a generated PrintBooks range
+PRINT_RANGE = 20
+# Number of distinct patrons
+PATRONS = 10000
+
+
+# Uniformly distributed bookIds in 1..n
+def uniform_sampler(n, rng):
+    return lambda: rng.randint(1, n)
+
+
+# Zipf distributed bookIds in 1..n with exponent s. Popularity ranks are spread over the id space with a
+# multiplicative permutation, so the hot books are not all adjacent.
+def zipf_sampler(n, rng, s=1.0):
+    cum_weights = list(itertools.accumulate(1.0 / rank ** s for rank in range(1, n + 1)))
+    total = cum_weights[-1]
+    stride = max(1, int(n * 0.6180339887))
+    while math.gcd(stride, n) != 1:
+        stride += 1
+
+    def sample():
+        rank = bisect.bisect_left(cum_weights, rng.random() * total)
+        return (rank * stride) % n + 1
+    return sample
+
+
+# Make a bookId sampler for a distribution name
+def make_sampler(distribution, n, rng, zipf_s=1.0):
+    if distribution == "uniform":
+        return uniform_sampler(n, rng)
+    if distribution == "zipf":
+        return zipf_sampler(n, rng, zipf_s)
+    raise ValueError(f"unknown distribution {distribution!r}")
+
+
+# Parse a mix given as "Command=weight,Command=weight"
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        comm, weight = item.split('=')
+        mix[comm.strip()] = float(weight)
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown:
+        raise ValueError(f"unsupported commands in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+# Arguments of InsertBook for a bookId, as used in command and catalog files
+def book_arguments(bookId):
+    return f'{bookId}, "Title {bookId}", "Author {bookId % 997}", "Yes"'
+
+
+# Yield the catalog of n books as InsertBook argument lines (the LoadCatalog format)
+def catalog_lines(n):
+    for bookId in range(1, n + 1):
+        yield book_arguments(bookId)
+
+
+# Yield operations command lines over a catalog of books 1..n
+# New books are inserted above n so that inserts never collide with the catalog
+def generate(n, operations, mix=None, distribution="uniform", seed=0, zipf_s=1.0):
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    commands = list(mix)
+    cum_weights = list(itertools.accumulate(mix[comm] for comm in commands))
+    sample = make_sampler(distribution, n, rng, zipf_s)
+    next_bookId = n + 1
+    for comm in rng.choices(commands, cum_weights=cum_weights, k=operations):
+        if comm == "InsertBook":
+            yield f"InsertBook({book_arguments(next_bookId)})"
+            next_bookId += 1
+        elif comm == "BorrowBook":
+            yield f"BorrowBook({rng.randint(1, PATRONS)}, {sample()}, {rng.randint(1, 5)})"
+        elif comm == "ReturnBook":
+            yield f"ReturnBook({rng.randint(1, PATRONS)}, {sample()})"
+        elif comm == "DeleteBook":
+            yield f"DeleteBook({sample()})"
+        elif comm == "PrintBooks":
+            start = sample()
+            yield f"PrintBooks({start}, {start + PRINT_RANGE - 1})"
+        elif comm == "FindClosestBook":
+            yield f"FindClosestBook({sample()})"
+        elif comm == "PrintBook":
+            yield f"PrintBook({sample()})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GatorLibrary workload generator")
+    parser.add_argument("--books", type=int, default=1000, help="catalog size")
+    parser.add_argument("--operations", type=int, default=10000, help="number of commands after the catalog")
+    parser.add_argument("--distribution", choices=("uniform", "zipf"), default="uniform")
+    parser.add_argument("--zipf-s", type=float, default=1.0, help="Zipf exponent")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="command weights, e.g. BorrowBook=50,ReturnBook=50")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--catalog", metavar="path",
+                        help="write the catalog to this file and load it with LoadCatalog instead of InsertBook lines")
+    parser.add_argument("-o", "--output", required=True, help="command file to write")
+    cli_args = parser.parse_args()
+
+    with open(cli_args.output, "w") as output_file:
+        if cli_args.catalog:
+            with open(cli_args.catalog, "w") as catalog_file:
+                for line in catalog_lines(cli_args.books):
+                    catalog_file.write(line + "\n")
+            output_file.write(f'LoadCatalog("{cli_args.catalog}")\n')
+        else:
+            for line in catalog_lines(cli_args.books):
+                output_file.write(f"InsertBook({line})\n")
+        for line in generate(cli_args.books, cli_args.operations, cli_args.mix, cli_args.distribution,
+                             cli_args.seed, cli_args.zipf_s):
+            output_file.write(line + "\n")
+        output_file.write("Quit()\n")